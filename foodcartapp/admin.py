@@ -1,4 +1,6 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.db.models import Case, When
 from django.shortcuts import redirect
 from django.shortcuts import reverse
 from django.templatetags.static import static
@@ -6,13 +8,14 @@ from django.utils.html import format_html
 from django.utils.http import url_has_allowed_host_and_scheme
 from django.utils import timezone
 
+from .models import Banner
 from .models import Product
 from .models import OrderedProduct
 from .models import Restaurant
 from .models import RestaurantMenuItem
 from .models import Order
 from geo.models import AddressPoint
-from .utils import get_available_restaurants_for_orders
+from .candidates import attach_candidates, find_candidates
 
 
 class RestaurantMenuItemInline(admin.TabularInline):
@@ -37,6 +40,10 @@ class RestaurantAdmin(admin.ModelAdmin):
         'address',
         'contact_phone',
     ]
+    readonly_fields = [
+        'latitude',
+        'longitude',
+    ]
     inlines = [
         RestaurantMenuItemInline
     ]
@@ -106,10 +113,30 @@ class ProductAdmin(admin.ModelAdmin):
         if not obj.image or not obj.id:
             return 'нет картинки'
         edit_url = reverse('admin:foodcartapp_product_change', args=(obj.id,))
-        return format_html('<a href="{edit_url}"><img src="{src}" style="max-height: 50px;"/></a>', edit_url=edit_url, src=obj.image.url)
+        return format_html('<a href="{edit_url}"><img src="{src}" style="max-height: 50px;"/></a>', edit_url=edit_url, src=obj.get_image_url('thumb') or obj.image.url)
     get_image_list_preview.short_description = 'превью'
 
 
+@admin.register(Banner)
+class BannerAdmin(admin.ModelAdmin):
+    list_display = [
+        'title',
+        'position',
+        'active_from',
+        'active_until',
+    ]
+    list_editable = [
+        'position',
+    ]
+
+
+class OrderChangeList(ChangeList):
+    def get_results(self, request):
+        super().get_results(request)
+        # Рестораны для всей страницы заказов ищутся разом, а не по заказу
+        self.result_list = attach_candidates(self.result_list)
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = [
@@ -139,15 +166,18 @@ class OrderAdmin(admin.ModelAdmin):
             return redirect(next_url, permanent=False)
         return super().response_change(request, obj)
 
+    def get_changelist(self, request, **kwargs):
+        return OrderChangeList
+
     def show_available_restaurants(self, obj):
-        orders = get_available_restaurants_for_orders([obj])
-        order = orders[0]
+        if not hasattr(obj, 'available_restaurants'):
+            attach_candidates([obj])
 
-        if not getattr(order, 'available_restaurants', None):
+        if not obj.available_restaurants:
             return "Нет доступных ресторанов"
 
         result = []
-        for restaurant, distance in order.available_restaurants:
+        for restaurant, distance in obj.available_restaurants:
             if distance is not None:
                 result.append(f"{restaurant.name} ({distance:.1f} км)")
             else:
@@ -162,32 +192,18 @@ class OrderAdmin(admin.ModelAdmin):
             order_id = request.resolver_match.kwargs.get("object_id")
             if order_id:
                 try:
-                    from foodcartapp.models import Order, Restaurant, RestaurantMenuItem
-                    from collections import defaultdict
-
-                    order = Order.objects.prefetch_related('products__product').get(pk=order_id)
+                    order = Order.objects.get(pk=order_id)
 
-                    order_product_ids = set(order.products.values_list('product_id', flat=True))
-                    if not order_product_ids:
+                    if not order.products.exists():
                         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
-                    menu_items = (
-                        RestaurantMenuItem.objects
-                        .filter(availability=True)
-                        .select_related('restaurant', 'product')
-                    )
-
-                    restaurant_menu = defaultdict(set)
-                    for item in menu_items:
-                        restaurant_menu[item.restaurant].add(item.product_id)
-
-                    restaurant_ids = [
-                        restaurant.id
-                        for restaurant, products in restaurant_menu.items()
-                        if order_product_ids.issubset(products)
-                    ]
-
-                    kwargs["queryset"] = Restaurant.objects.filter(id__in=restaurant_ids)
+                    candidates = find_candidates([order])[order.id]
+                    kwargs["queryset"] = Restaurant.objects.filter(
+                        id__in=[candidate.restaurant.id for candidate in candidates]
+                    ).order_by(Case(*[
+                        When(id=candidate.restaurant.id, then=rank)
+                        for rank, candidate in enumerate(candidates)
+                    ]))
 
                 except Order.DoesNotExist:
                     pass
@@ -0,0 +1,149 @@
+import json
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+
+COUNTER_TIMEOUT = 60
+
+
+def get_cache():
+    return caches[settings.ADMISSION_CACHE]
+
+
+def get_client_ip(request):
+    forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if forwarded_for and settings.ADMISSION_TRUST_X_FORWARDED_FOR:
+        return forwarded_for.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def get_client_keys(request):
+    return [f'ip:{get_client_ip(request)}']
+
+
+def get_order_client_keys(request):
+    client_keys = get_client_keys(request)
+    if request.content_type != 'application/json':
+        return client_keys
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return client_keys
+    orders = payload if isinstance(payload, list) else [payload]
+    phonenumbers = {
+        order.get('phonenumber')
+        for order in orders
+        if isinstance(order, dict) and isinstance(order.get('phonenumber'), str)
+    }
+    # Пачку заказов от агрегатора ограничиваем по IP, а не по телефонам
+    if len(phonenumbers) == 1:
+        digits = ''.join(char for char in phonenumbers.pop() if char.isdigit())
+        client_keys.append(f'phone:{digits}')
+    return client_keys
+
+
+def acquire_slot(cache, key, limit):
+    cache.add(key, 0, COUNTER_TIMEOUT)
+    try:
+        in_flight = cache.incr(key)
+    except ValueError:
+        # Счётчик успел истечь между add и incr
+        cache.set(key, 1, COUNTER_TIMEOUT)
+        in_flight = 1
+    # Счётчик живёт, пока идут запросы: add задаёт срок только новому ключу,
+    # и без продления он истекал бы посреди нагрузки, обнуляя занятые слоты
+    cache.touch(key, COUNTER_TIMEOUT)
+    if in_flight > limit:
+        release_slot(cache, key)
+        return False
+    return True
+
+
+def release_slot(cache, key):
+    try:
+        in_flight = cache.decr(key)
+    except ValueError:
+        return
+    if in_flight < 0:
+        # Счётчик истёк и создан заново, пока запрос выполнялся.
+        # Возвращаем разницу, а не пишем 0, чтобы не затереть чужой incr.
+        cache.incr(key, -in_flight)
+
+
+def take_token(cache, key, rate, burst):
+    """Списывает токен из корзины клиента.
+
+    Возвращает 0, если токен был, иначе — сколько секунд ждать следующего.
+    Чтение и запись корзины не атомарны: при гонке клиент может получить
+    на пару запросов больше, чем положено, и это приемлемо.
+    """
+    now = time.time()
+    tokens, updated_at = cache.get(key, (burst, now))
+    tokens = min(burst, tokens + (now - updated_at) * rate)
+    if tokens < 1:
+        return (1 - tokens) / rate
+    cache.set(key, (tokens - 1, now), math.ceil(burst / rate) + 1)
+    return 0
+
+
+def reject(status, detail, retry_after):
+    response = JsonResponse({'detail': detail}, status=status)
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def admission_control(scope, get_keys=get_client_keys):
+    """Отклоняет запросы сверх лимитов вместо того, чтобы ставить их в очередь.
+
+    Лимиты области `scope` берутся из `settings.ADMISSION_SCOPES`:
+    `concurrency` — сколько запросов области обрабатывается одновременно,
+    `in_flight_share` — какую долю от `ADMISSION_MAX_IN_FLIGHT` могут занять
+    запросы области (так приём заказов вытесняет чтение каталога),
+    `rate` и `burst` — корзина токенов для каждого клиента.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not settings.ADMISSION_CONTROL:
+                return view(request, *args, **kwargs)
+
+            limits = settings.ADMISSION_SCOPES[scope]
+            cache = get_cache()
+
+            for client_key in get_keys(request):
+                retry_after = take_token(
+                    cache,
+                    f'admission:{scope}:bucket:{client_key}',
+                    limits['rate'],
+                    limits['burst'],
+                )
+                if retry_after:
+                    return reject(429, 'Слишком много запросов.', retry_after)
+
+            max_in_flight = math.floor(
+                settings.ADMISSION_MAX_IN_FLIGHT * limits['in_flight_share']
+            )
+            slots = [
+                (f'admission:{scope}:in_flight', limits['concurrency']),
+                ('admission:in_flight', max_in_flight),
+            ]
+            acquired = []
+            for key, limit in slots:
+                if not acquire_slot(cache, key, limit):
+                    for acquired_key in acquired:
+                        release_slot(cache, acquired_key)
+                    return reject(503, 'Сервер перегружен, попробуйте позже.', 1)
+                acquired.append(key)
+
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                for key in acquired:
+                    release_slot(cache, key)
+        return wrapper
+    return decorator
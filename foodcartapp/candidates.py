@@ -0,0 +1,269 @@
+import logging
+import operator
+import threading
+from collections import namedtuple
+from functools import reduce
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .capabilities import capability_index
+from .distances import get_distance_matrix, refine_close_calls
+from .models import Order, OrderCandidate, OrderedProduct
+from .spatial import restaurant_locations
+from .utils import geocoding_executor, get_coordinates
+
+
+logger = logging.getLogger(__name__)
+
+REFRESH_CHUNK_SIZE = 500
+
+
+Candidate = namedtuple('Candidate', ['restaurant', 'distance'])
+
+pending_refreshes = threading.local()
+
+
+def get_baskets(orders):
+    """Товары каждого заказа одним запросом на все заказы."""
+    baskets = {order.id: set() for order in orders}
+    ordered_products = (
+        OrderedProduct.objects
+        .filter(order_id__in=baskets)
+        .values_list('order_id', 'product_id')
+    )
+    for order_id, product_id in ordered_products:
+        baskets[order_id].add(product_id)
+    return baskets
+
+
+def sort_candidates(candidates):
+    candidates.sort(
+        key=lambda candidate: (candidate.distance is None, candidate.distance or 0)
+    )
+    return candidates
+
+
+def rank_all_candidates(orders, baskets, index, geocode):
+    restaurants = {
+        order.id: index.find_restaurants(baskets[order.id])
+        for order in orders
+    }
+
+    order_addresses = sorted({order.address for order in orders})
+    coordinates = get_coordinates(order_addresses, geocode)
+    order_addresses = [address for address in order_addresses if coordinates.get(address)]
+    located_restaurants = list({
+        restaurant.id: restaurant
+        for order_restaurants in restaurants.values()
+        for restaurant in order_restaurants
+        if restaurant.get_point()
+    }.values())
+    distance_matrix = get_distance_matrix(
+        [coordinates[address] for address in order_addresses],
+        [restaurant.get_point() for restaurant in located_restaurants],
+    )
+    order_distances = {
+        address: {
+            restaurant.id: distance
+            for restaurant, distance in zip(located_restaurants, distances)
+        }
+        for address, distances in zip(order_addresses, distance_matrix)
+    }
+
+    candidates = {}
+    for order in orders:
+        distances = order_distances.get(order.address, {})
+        candidates[order.id] = sort_candidates([
+            Candidate(restaurant, distances.get(restaurant.id))
+            for restaurant in restaurants[order.id]
+        ])
+    return candidates
+
+
+def find_nearest_candidates(orders, baskets, index, geocode):
+    """Обходит рестораны от ближнего к дальнему и проверяет меню только у них."""
+    limit = settings.CANDIDATES_NEAREST_COUNT
+    max_distance = settings.CANDIDATES_MAX_DISTANCE_KM
+    locations = restaurant_locations.get_locations()
+    coordinates = get_coordinates({order.address for order in orders}, geocode)
+
+    candidates = {}
+    for order in orders:
+        order_candidates = []
+        candidates[order.id] = order_candidates
+        mask = index.get_basket_mask(baskets[order.id])
+        if mask is None:
+            continue
+
+        order_point = coordinates.get(order.address)
+        if order_point:
+            for restaurant_id, distance in locations.iter_nearest(order_point, max_distance):
+                if not index.can_cook(restaurant_id, mask):
+                    continue
+                order_candidates.append(Candidate(index.restaurants[restaurant_id], distance))
+                if limit and len(order_candidates) >= limit:
+                    break
+
+        if settings.DISTANCE_PRECISE and order_candidates:
+            distances = refine_close_calls(
+                order_point,
+                [locations.points[candidate.restaurant.id] for candidate in order_candidates],
+                [candidate.distance for candidate in order_candidates],
+            )
+            order_candidates[:] = sort_candidates([
+                Candidate(candidate.restaurant, distance)
+                for candidate, distance in zip(order_candidates, distances)
+            ])
+
+        if max_distance is None:
+            # Без координат расстояние неизвестно, такие рестораны идут в конце
+            order_candidates.extend(
+                Candidate(restaurant, None)
+                for restaurant in index.find_restaurants(baskets[order.id])
+                if not order_point or restaurant.id not in locations.points
+            )
+            del order_candidates[limit:]
+    return candidates
+
+
+def find_candidates(orders, geocode=False):
+    """Рестораны, которые могут приготовить заказ, от ближнего к дальнему.
+
+    Возвращает словарь: id заказа → список `Candidate` с расстоянием
+    в километрах. Рестораны, до которых расстояние неизвестно, идут
+    в конце списка. Число запросов к базе не зависит от числа заказов.
+
+    Если заданы `CANDIDATES_NEAREST_COUNT` или `CANDIDATES_MAX_DISTANCE_KM`,
+    рестораны ищутся по сетке координат, иначе для всех подходящих
+    ресторанов считается матрица расстояний.
+
+    Адреса заказов геокодируются, только если передан `geocode=True`:
+    страницы берут лишь уже известные координаты, а ищет их фоновый пересчёт.
+    """
+    orders = list(orders)
+    baskets = get_baskets(orders)
+    index = capability_index.get_index()
+    if settings.CANDIDATES_NEAREST_COUNT or settings.CANDIDATES_MAX_DISTANCE_KM is not None:
+        return find_nearest_candidates(orders, baskets, index, geocode)
+    return rank_all_candidates(orders, baskets, index, geocode)
+
+
+def attach_candidates(orders):
+    """Кладёт в `order.available_restaurants` подходящие рестораны заказа."""
+    orders = list(orders)
+    candidates = find_candidates(orders)
+    for order in orders:
+        order.available_restaurants = candidates[order.id]
+    return orders
+
+
+def refresh_order_candidates(orders, geocode=True):
+    """Пересчитывает таблицу `OrderCandidate` для заказов `orders`."""
+    orders = list(orders)
+    candidates = find_candidates(orders, geocode)
+    with transaction.atomic():
+        OrderCandidate.objects.filter(order__in=orders).delete()
+        OrderCandidate.objects.bulk_create([
+            OrderCandidate(
+                order=order,
+                restaurant=candidate.restaurant,
+                distance_km=candidate.distance,
+                rank=rank,
+            )
+            for order in orders
+            for rank, candidate in enumerate(candidates[order.id])
+        ])
+        # Заказ без подходящих ресторанов тоже посчитан, хотя строк у него нет
+        Order.objects.filter(pk__in=[order.pk for order in orders]).update(
+            candidates_refreshed_at=timezone.now(),
+        )
+
+
+def attach_missing_candidates(orders):
+    """Считает кандидатов на лету для заказов, которые ещё не пересчитывались.
+
+    Ожидает заказы, загруженные через `with_candidates()`. Так менеджер
+    видит рестораны и для заказов, созданных до появления таблицы, пока их
+    не пересчитает команда `rebuild_order_candidates`. Заказы, которые
+    никто не может приготовить, уже посчитаны и берутся из таблицы как есть.
+    """
+    orders = list(orders)
+    missing_orders = [
+        order for order in orders
+        if order.restaurant_id is None and order.candidates_refreshed_at is None
+    ]
+    if missing_orders:
+        candidates = find_candidates(missing_orders)
+        for order in missing_orders:
+            order.available_candidates = [
+                OrderCandidate(
+                    order=order,
+                    restaurant=candidate.restaurant,
+                    distance_km=candidate.distance,
+                    rank=rank,
+                )
+                for rank, candidate in enumerate(candidates[order.id])
+            ]
+    return orders
+
+
+def refresh_open_orders_candidates(condition=Q(), geocode=True):
+    """Пересчитывает кандидатов заказов без ресторана, подходящих под `condition`."""
+    order_ids = list(
+        Order.objects
+        .filter(condition, restaurant__isnull=True)
+        .values_list('id', flat=True)
+        .distinct()
+    )
+    for start in range(0, len(order_ids), REFRESH_CHUNK_SIZE):
+        chunk_ids = order_ids[start:start + REFRESH_CHUNK_SIZE]
+        refresh_order_candidates(Order.objects.filter(pk__in=chunk_ids), geocode)
+
+
+def run_candidates_refresh(condition):
+    close_old_connections()
+    try:
+        refresh_open_orders_candidates(condition)
+    except Exception:
+        logger.exception('Не удалось пересчитать рестораны для заказов %s', condition)
+    finally:
+        close_old_connections()
+
+
+def flush_candidates_refresh():
+    conditions = getattr(pending_refreshes, 'conditions', None)
+    if not conditions:
+        return
+    pending_refreshes.conditions = []
+    if all(conditions):
+        condition = reduce(operator.or_, conditions)
+    else:
+        # Пустое условие — пересчитать все открытые заказы
+        condition = Q()
+
+    if settings.GEOCODE_IN_BACKGROUND:
+        geocoding_executor.submit(run_candidates_refresh, condition)
+    else:
+        # Пересчёт идёт в запросе, например в /api/order/, и Геокодер не ждёт:
+        # новые адреса заказов найдёт команда geocode_addresses
+        refresh_open_orders_candidates(condition, geocode=False)
+
+
+def schedule_candidates_refresh(**filters):
+    """Пересчитывает кандидатов открытых заказов после фиксации транзакции.
+
+    Все вызовы за одну транзакцию сливаются в один пересчёт: сохранение
+    ресторана со всеми пунктами меню в админке пересчитывает заказы один раз.
+    Условия из откатившейся транзакции уйдут со следующим пересчётом —
+    лишний пересчёт ничего не портит.
+
+    Если адреса геокодируются в фоне, пересчёт встаёт в ту же очередь
+    после геокодирования, чтобы расстояния считались по свежим координатам.
+    Иначе пересчёт идёт в том же запросе и берёт только известные координаты.
+    """
+    conditions = pending_refreshes.__dict__.setdefault('conditions', [])
+    conditions.append(Q(**filters))
+    transaction.on_commit(flush_candidates_refresh)
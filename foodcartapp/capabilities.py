@@ -0,0 +1,80 @@
+import threading
+
+from .catalog import MENUS_VERSION_KEY, get_version
+
+
+class RestaurantCapabilityIndex:
+    """Какие рестораны могут приготовить корзину целиком.
+
+    Каждому товару из меню достаётся номер бита, а меню ресторана хранится
+    как целое число с битами доступных товаров. Ресторан может собрать
+    заказ, если в его маске есть все биты корзины.
+    """
+
+    def __init__(self, menu_items):
+        self.product_bits = {}
+        self.restaurants = {}
+        self.restaurant_masks = {}
+        for item in menu_items:
+            bit = self.product_bits.setdefault(item.product_id, len(self.product_bits))
+            self.restaurants[item.restaurant_id] = item.restaurant
+            self.restaurant_masks[item.restaurant_id] = (
+                self.restaurant_masks.get(item.restaurant_id, 0) | 1 << bit
+            )
+
+    def get_basket_mask(self, product_ids):
+        """Маска корзины или None, если какого-то товара нет ни в одном меню."""
+        mask = 0
+        for product_id in product_ids:
+            bit = self.product_bits.get(product_id)
+            if bit is None:
+                return None
+            mask |= 1 << bit
+        return mask
+
+    def can_cook(self, restaurant_id, mask):
+        # Ресторан без доступного меню не готовит даже пустую корзину
+        restaurant_mask = self.restaurant_masks.get(restaurant_id)
+        if restaurant_mask is None:
+            return False
+        return restaurant_mask & mask == mask
+
+    def find_restaurants(self, product_ids):
+        mask = self.get_basket_mask(product_ids)
+        if mask is None:
+            return []
+        return [
+            self.restaurants[restaurant_id]
+            for restaurant_id in self.restaurant_masks
+            if self.can_cook(restaurant_id, mask)
+        ]
+
+
+class CapabilityIndexHolder:
+    """Держит индекс процесса и пересобирает его при смене версии меню."""
+
+    def __init__(self):
+        self.index = None
+        self.version = None
+        self.lock = threading.Lock()
+
+    def get_index(self):
+        from .models import RestaurantMenuItem
+
+        version = get_version(MENUS_VERSION_KEY)
+        if self.version == version:
+            return self.index
+        with self.lock:
+            if self.version != version:
+                menu_items = (
+                    RestaurantMenuItem.objects
+                    .filter(availability=True)
+                    .select_related('restaurant')
+                    .order_by('restaurant_id', 'product_id')
+                )
+                self.index = RestaurantCapabilityIndex(menu_items)
+                self.version = version
+        return self.index
+
+
+capability_index = CapabilityIndexHolder()
@@ -0,0 +1,184 @@
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+
+CATALOG_VERSION_KEY = 'catalog:version'
+PRODUCTS_VERSION_KEY = 'catalog:products:version'
+BANNERS_VERSION_KEY = 'catalog:banners:version'
+MENUS_VERSION_KEY = 'catalog:menus:version'
+RESTAURANTS_VERSION_KEY = 'catalog:restaurants:version'
+
+local_snapshots = {}
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE]
+
+
+def get_restaurant_menu_version_key(restaurant_id):
+    return f'catalog:restaurant:{restaurant_id}:version'
+
+
+def make_catalog_version():
+    return f'{time.time_ns():x}'
+
+
+def get_shared_cache():
+    """Общий кэш процессов или None, если у каждого процесса свой кэш в памяти."""
+    cache = get_cache()
+    if isinstance(cache, LocMemCache):
+        return None
+    return cache
+
+
+def load_versions(keys, create):
+    from .models import CatalogVersion
+
+    versions = dict(
+        CatalogVersion.objects.filter(key__in=keys).values_list('key', 'version')
+    )
+    missing_keys = [key for key in keys if key not in versions]
+    if missing_keys and create:
+        version = make_catalog_version()
+        CatalogVersion.objects.bulk_create(
+            [CatalogVersion(key=key, version=version) for key in missing_keys],
+            ignore_conflicts=True,
+        )
+        versions.update(
+            CatalogVersion.objects
+            .filter(key__in=missing_keys)
+            .values_list('key', 'version')
+        )
+    return versions
+
+
+def get_versions(keys, create=True):
+    """Текущие версии `keys`.
+
+    Версии хранятся в базе: кэш по умолчанию свой у каждого процесса,
+    и изменение в одном воркере не дошло бы до остальных. Если кэш общий,
+    версии читаются из него, а в базу запрос идёт, только когда какой-то
+    версии в кэше нет. Недостающие версии создаются, если не передан
+    `create=False`.
+    """
+    cache = get_shared_cache()
+    if cache is None:
+        return load_versions(keys, create)
+
+    versions = cache.get_many(keys)
+    missing_keys = [key for key in keys if key not in versions]
+    if missing_keys:
+        loaded_versions = load_versions(missing_keys, create)
+        for key, version in loaded_versions.items():
+            # add, а не set: версия из базы могла устареть, пока её читали
+            cache.add(key, version, None)
+        versions.update(cache.get_many(list(loaded_versions)))
+    return versions
+
+
+def get_version(key):
+    return get_versions([key])[key]
+
+
+def get_catalog_version():
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def get_restaurant_menu_version(restaurant_id):
+    """Меню ресторана зависит и от его пунктов меню, и от самих товаров.
+
+    Возвращает None, если ресторана нет: версии заводятся только
+    существующим ресторанам, чтобы запросы к чужим id не копили строки.
+    """
+    from .models import Restaurant
+
+    menu_key = get_restaurant_menu_version_key(restaurant_id)
+    keys = [PRODUCTS_VERSION_KEY, menu_key]
+    versions = get_versions(keys, create=False)
+    if len(versions) < len(keys):
+        if menu_key not in versions and not Restaurant.objects.filter(pk=restaurant_id).exists():
+            return None
+        versions = get_versions(keys)
+    return f'{versions[PRODUCTS_VERSION_KEY]}.{versions[menu_key]}'
+
+
+def bump_versions(keys):
+    from .models import CatalogVersion
+
+    version = make_catalog_version()
+    CatalogVersion.objects.bulk_create(
+        [CatalogVersion(key=key, version=version) for key in keys],
+        update_conflicts=True,
+        unique_fields=['key'],
+        update_fields=['version'],
+    )
+    cache = get_shared_cache()
+    if cache is not None:
+        cache.set_many({key: version for key in keys}, None)
+
+
+def delete_versions(keys):
+    from .models import CatalogVersion
+
+    CatalogVersion.objects.filter(key__in=keys).delete()
+    cache = get_shared_cache()
+    if cache is not None:
+        cache.delete_many(keys)
+
+
+def schedule_catalog_version_bump(*version_keys):
+    """Меняет версию каталога и версии `version_keys` после фиксации транзакции.
+
+    Если сменить версию раньше, другой процесс успеет собрать снимок
+    из старых данных и сохранить его под новой версией.
+    """
+    keys = [CATALOG_VERSION_KEY, *version_keys]
+    transaction.on_commit(lambda: bump_versions(keys))
+
+
+def get_request_catalog_version(request):
+    # ETag, Last-Modified и снимок берут одну версию, и она читается один раз
+    if not hasattr(request, 'catalog_version'):
+        request.catalog_version = get_catalog_version()
+    return request.catalog_version
+
+
+def get_version_time(version):
+    return datetime.fromtimestamp(int(version, 16) / 1e9, tz=timezone.utc)
+
+
+def catalog_etag(request, *args, **kwargs):
+    return get_request_catalog_version(request)
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    return get_version_time(get_request_catalog_version(request))
+
+
+def get_snapshot(name, build, version=None):
+    """Возвращает готовые байты снимка `name` для версии `version`.
+
+    По умолчанию берётся текущая версия каталога. Снимок ищется сначала
+    в памяти процесса, потом в общем кэше, и только если его нет и там —
+    собирается функцией `build`.
+    """
+    if version is None:
+        version = get_catalog_version()
+    snapshot = local_snapshots.get(name)
+    if snapshot and snapshot[0] == version:
+        return snapshot[1]
+
+    cache = get_cache()
+    cache_key = f'catalog:{name}:{version}'
+    content = cache.get(cache_key)
+    if content is None:
+        content = build()
+        cache.set(cache_key, content, settings.CATALOG_SNAPSHOT_TTL)
+
+    local_snapshots[name] = (version, content)
+    return content
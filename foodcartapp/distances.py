@@ -0,0 +1,98 @@
+import math
+
+from django.conf import settings
+from geopy import distance
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+EARTH_RADIUS_KM = 6371.0088
+# Гаверсинус считает Землю шаром и ошибается не больше чем на 0,5 %
+HAVERSINE_ERROR = 0.005
+
+
+def haversine(point1, point2):
+    lat1, lon1 = map(math.radians, point1)
+    lat2, lon2 = map(math.radians, point2)
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def haversine_matrix_numpy(origins, destinations):
+    origins = numpy.radians(numpy.asarray(origins, dtype=float))
+    destinations = numpy.radians(numpy.asarray(destinations, dtype=float))
+    lat1 = origins[:, 0, numpy.newaxis]
+    lon1 = origins[:, 1, numpy.newaxis]
+    lat2 = destinations[numpy.newaxis, :, 0]
+    lon2 = destinations[numpy.newaxis, :, 1]
+    a = (
+        numpy.sin((lat2 - lat1) / 2) ** 2
+        + numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin((lon2 - lon1) / 2) ** 2
+    )
+    return (2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.sqrt(a))).tolist()
+
+
+def haversine_matrix_python(origins, destinations):
+    destinations = [
+        (math.radians(lat), math.radians(lon), math.cos(math.radians(lat)))
+        for lat, lon in destinations
+    ]
+    matrix = []
+    for lat, lon in origins:
+        lat1, lon1 = math.radians(lat), math.radians(lon)
+        cos_lat1 = math.cos(lat1)
+        matrix.append([
+            2 * EARTH_RADIUS_KM * math.asin(math.sqrt(
+                math.sin((lat2 - lat1) / 2) ** 2
+                + cos_lat1 * cos_lat2 * math.sin((lon2 - lon1) / 2) ** 2
+            ))
+            for lat2, lon2, cos_lat2 in destinations
+        ])
+    return matrix
+
+
+def haversine_matrix(origins, destinations):
+    """Расстояния в километрах от каждой точки `origins` до каждой из `destinations`.
+
+    Точки — пары (широта, долгота). С NumPy вся матрица считается разом,
+    без него — циклом на чистом Python.
+    """
+    if not origins or not destinations:
+        return [[] for _ in origins]
+    if numpy:
+        return haversine_matrix_numpy(origins, destinations)
+    return haversine_matrix_python(origins, destinations)
+
+
+def refine_close_calls(origin, destinations, distances):
+    """Пересчитывает по геодезической те расстояния, где гаверсинус мог перепутать порядок."""
+    order = sorted(range(len(distances)), key=distances.__getitem__)
+    close_calls = set()
+    for nearer, farther in zip(order, order[1:]):
+        if distances[farther] - distances[nearer] <= distances[farther] * HAVERSINE_ERROR * 2:
+            close_calls.update([nearer, farther])
+    for position in close_calls:
+        distances[position] = distance.distance(origin, destinations[position]).km
+    return distances
+
+
+def get_distance_matrix(origins, destinations, precise=None):
+    """Матрица расстояний в километрах, числа с плавающей точкой.
+
+    В точном режиме (`settings.DISTANCE_PRECISE`) расстояния, которые
+    различаются меньше погрешности гаверсинуса, уточняются геодезической
+    на эллипсоиде, чтобы не перепутать, какой ресторан ближе.
+    """
+    if precise is None:
+        precise = settings.DISTANCE_PRECISE
+    matrix = haversine_matrix(origins, destinations)
+    if precise:
+        for origin, distances in zip(origins, matrix):
+            refine_close_calls(origin, destinations, distances)
+    return matrix
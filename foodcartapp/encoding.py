@@ -0,0 +1,100 @@
+import gzip
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.module_loading import import_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+ENCODINGS = ['br', 'gzip'] if brotli else ['gzip']
+
+
+def dumps_pretty_json(data):
+    return json.dumps(
+        data,
+        cls=DjangoJSONEncoder,
+        ensure_ascii=False,
+        indent=4,
+    ).encode()
+
+
+def dumps_json(data):
+    return json.dumps(
+        data,
+        cls=DjangoJSONEncoder,
+        ensure_ascii=False,
+        separators=(',', ':'),
+    ).encode()
+
+
+def encode_decimal(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError
+
+
+def dumps_orjson(data):
+    import orjson
+    return orjson.dumps(data, default=encode_decimal)
+
+
+def get_json_encoder():
+    if not settings.API_JSON_COMPACT:
+        return dumps_pretty_json
+    return import_string(settings.API_JSON_ENCODER)
+
+
+def encode_json(data):
+    return get_json_encoder()(data)
+
+
+def compress(content):
+    """Готовит все варианты тела ответа, чтобы не сжимать его на каждый запрос."""
+    variants = {
+        'identity': content,
+        'gzip': gzip.compress(content, compresslevel=9, mtime=0),
+    }
+    if brotli:
+        variants['br'] = brotli.compress(content, quality=11)
+    return variants
+
+
+def compress_fast(content):
+    """Сжимает ответ, который собирается на каждый запрос и не кэшируется."""
+    return {
+        'identity': content,
+        'gzip': gzip.compress(content, compresslevel=6, mtime=0),
+    }
+
+
+def negotiate_encoding(request, encodings=ENCODINGS):
+    accepted = set()
+    for coding in request.headers.get('Accept-Encoding', '').split(','):
+        name, _, params = coding.partition(';')
+        params = params.replace(' ', '')
+        if params in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(name.strip().lower())
+
+    for encoding in encodings:
+        if encoding in accepted or '*' in accepted:
+            return encoding
+    return 'identity'
+
+
+def encoded_response(request, variants, content_type='application/json'):
+    encodings = [encoding for encoding in ENCODINGS if encoding in variants]
+    encoding = negotiate_encoding(request, encodings)
+    response = HttpResponse(variants[encoding], content_type=content_type)
+    if encoding != 'identity':
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
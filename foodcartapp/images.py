@@ -0,0 +1,156 @@
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+logger = logging.getLogger(__name__)
+
+images_executor = ThreadPoolExecutor(
+    max_workers=1,
+    thread_name_prefix='images',
+)
+
+IMAGE_SIZES = {
+    'thumb': 100,
+    'card': 400,
+    'full': 1200,
+}
+
+
+def get_variant_name(digest, size, extension):
+    return f'derivatives/{digest[:2]}/{digest}/{size}.{extension}'
+
+
+def save_variant(storage, name, image, image_format, **options):
+    if storage.exists(name):
+        return
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def generate_image_variants(image_file):
+    """Сохраняет уменьшенные копии картинки товара и их WebP-версии.
+
+    Имена копий зависят от хэша содержимого картинки, поэтому повторная
+    загрузка того же файла ничего не пересчитывает. Возвращает описание
+    копий для `Product.image_variants` или пустой словарь, если картинку
+    не удалось прочитать.
+    """
+    storage = image_file.storage
+    try:
+        with storage.open(image_file.name, 'rb') as file:
+            content = file.read()
+        image = ImageOps.exif_transpose(Image.open(BytesIO(content)))
+    except FileNotFoundError:
+        logger.warning('Нет файла картинки %s', image_file.name)
+        return {}
+    except (OSError, UnidentifiedImageError):
+        logger.exception('Не удалось прочитать картинку %s', image_file.name)
+        return {}
+
+    digest = hashlib.sha1(content).hexdigest()
+    has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+    extension = 'png' if has_alpha else 'jpg'
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    widths = {}
+    for size, max_width in IMAGE_SIZES.items():
+        variant = image.copy()
+        variant.thumbnail((max_width, max_width * 4), Image.LANCZOS)
+        if has_alpha:
+            save_variant(
+                storage,
+                get_variant_name(digest, size, extension),
+                variant,
+                'PNG',
+                optimize=True,
+            )
+        else:
+            save_variant(
+                storage,
+                get_variant_name(digest, size, extension),
+                variant,
+                'JPEG',
+                quality=85,
+                optimize=True,
+                progressive=True,
+            )
+        save_variant(
+            storage,
+            get_variant_name(digest, size, 'webp'),
+            variant,
+            'WEBP',
+            quality=80,
+            method=6,
+        )
+        widths[size] = variant.width
+
+    return {
+        'digest': digest,
+        'extension': extension,
+        'widths': widths,
+    }
+
+
+def delete_image_variants(storage, image_variants):
+    for size in image_variants['widths']:
+        for extension in [image_variants['extension'], 'webp']:
+            storage.delete(get_variant_name(image_variants['digest'], size, extension))
+
+
+def refresh_product_image_variants(product_id, image_name):
+    """Создаёт копии новой картинки товара и удаляет копии прежней.
+
+    Копии прежней картинки остаются, если её использует другой товар.
+    """
+    from .models import Product
+
+    products = Product.objects.filter(pk=product_id, image=image_name)
+    product = products.first()
+    if product is None:
+        # Картинку успели сменить ещё раз, её копии создаст следующая задача
+        return
+    old_variants = product.image_variants
+    image_variants = generate_image_variants(product.image)
+    if not products.update(image_variants=image_variants):
+        return
+    if not old_variants or old_variants['digest'] == image_variants.get('digest'):
+        return
+    if not Product.objects.filter(image_variants__digest=old_variants['digest']).exists():
+        delete_image_variants(product.image.storage, old_variants)
+
+
+def run_image_variants_refresh(product_id, image_name):
+    close_old_connections()
+    try:
+        refresh_product_image_variants(product_id, image_name)
+    except Exception:
+        logger.exception('Не удалось обновить копии картинки %s', image_name)
+    finally:
+        close_old_connections()
+
+
+def get_variant_url(storage, image_variants, size, extension=None):
+    if not image_variants:
+        return None
+    return storage.url(get_variant_name(
+        image_variants['digest'],
+        size,
+        extension or image_variants['extension'],
+    ))
+
+
+def get_srcset(storage, image_variants, extension=None):
+    if not image_variants:
+        return None
+    sources = {}
+    for size, width in image_variants['widths'].items():
+        # Маленькую картинку не увеличиваем, и копии разных размеров совпадают
+        sources.setdefault(width, get_variant_url(storage, image_variants, size, extension))
+    return ', '.join(f'{url} {width}w' for width, url in sources.items())
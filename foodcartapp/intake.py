@@ -0,0 +1,248 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+from .models import Order
+from .serializers import OrderSerializer, create_orders, fetch_products
+
+
+JOURNAL_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS order_intake (
+    ticket TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    order_id INTEGER,
+    errors TEXT,
+    idempotency_key TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS order_intake_pending
+    ON order_intake (created_at) WHERE status = 'pending';
+'''
+
+IDEMPOTENCY_KEY_SCHEMA = '''
+CREATE UNIQUE INDEX IF NOT EXISTS order_intake_idempotency_key
+    ON order_intake (idempotency_key);
+'''
+
+# Колонки, которых нет в журналах, созданных прежними версиями
+ADDED_COLUMNS = {
+    'idempotency_key': 'TEXT',
+    'attempts': 'INTEGER NOT NULL DEFAULT 0',
+}
+
+SAVE_FAILED_ERRORS = {'non_field_errors': ['Не удалось сохранить заказ.']}
+
+_local = threading.local()
+
+
+class IdempotencyKeyReused(Exception):
+    """Ключ идемпотентности уже использован для другого заказа."""
+
+
+def get_journal():
+    connection = getattr(_local, 'connection', None)
+    if (
+        connection is None
+        or _local.pid != os.getpid()
+        or _local.path != settings.ORDER_INTAKE_JOURNAL
+    ):
+        connection = sqlite3.connect(
+            settings.ORDER_INTAKE_JOURNAL,
+            timeout=30,
+            isolation_level=None,
+        )
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=FULL')
+        connection.executescript(JOURNAL_SCHEMA)
+        columns = {row[1] for row in connection.execute('PRAGMA table_info(order_intake)')}
+        for column, definition in ADDED_COLUMNS.items():
+            if column not in columns:
+                connection.execute(f'ALTER TABLE order_intake ADD COLUMN {column} {definition}')
+        connection.executescript(IDEMPOTENCY_KEY_SCHEMA)
+        _local.connection = connection
+        _local.pid = os.getpid()
+        _local.path = settings.ORDER_INTAKE_JOURNAL
+    return connection
+
+
+def enqueue_order(order_data, idempotency_key=None):
+    """Кладёт заказ в журнал и возвращает номер билета.
+
+    Повтор с тем же `idempotency_key` получает билет первого запроса,
+    даже если тот ещё не успел сохранить свой ответ в базе сайта.
+    Если под этим ключом в журнале другой заказ, бросает `IdempotencyKeyReused`.
+    """
+    journal = get_journal()
+    payload = json.dumps(order_data, ensure_ascii=False)
+    if idempotency_key is None:
+        ticket = uuid.uuid4().hex
+        journal.execute(
+            'INSERT INTO order_intake (ticket, payload, created_at) VALUES (?, ?, ?)',
+            (ticket, payload, time.time()),
+        )
+        return ticket
+
+    now = time.time()
+    journal.execute('BEGIN IMMEDIATE')
+    try:
+        # Просроченный ключ можно использовать снова, как и в IdempotencyKey
+        journal.execute(
+            '''UPDATE order_intake SET idempotency_key = NULL
+            WHERE idempotency_key = ? AND created_at < ?''',
+            (idempotency_key, now - settings.ORDER_IDEMPOTENCY_KEY_TTL),
+        )
+        journal.execute(
+            '''INSERT INTO order_intake (ticket, payload, created_at, idempotency_key)
+            VALUES (?, ?, ?, ?) ON CONFLICT (idempotency_key) DO NOTHING''',
+            (uuid.uuid4().hex, payload, now, idempotency_key),
+        )
+        ticket, stored_payload = journal.execute(
+            'SELECT ticket, payload FROM order_intake WHERE idempotency_key = ?',
+            (idempotency_key,),
+        ).fetchone()
+    except sqlite3.Error:
+        journal.execute('ROLLBACK')
+        raise
+    journal.execute('COMMIT')
+    if stored_payload != payload:
+        raise IdempotencyKeyReused(idempotency_key)
+    return ticket
+
+
+def get_ticket(ticket):
+    row = get_journal().execute(
+        'SELECT status, order_id, errors FROM order_intake WHERE ticket = ?',
+        (ticket,),
+    ).fetchone()
+    if row is None:
+        return None
+
+    status, order_id, errors = row
+    ticket_info = {'ticket': ticket, 'status': status}
+    if order_id is not None:
+        ticket_info['order_id'] = order_id
+    if errors is not None:
+        ticket_info['errors'] = json.loads(errors)
+    return ticket_info
+
+
+def create_orders_one_by_one(valid_orders):
+    """Сохраняет заказы по одному: билет → заказ и билеты, которые не сохранились."""
+    created_orders = {}
+    failed_tickets = []
+    for order_data in valid_orders:
+        try:
+            with transaction.atomic():
+                order, = create_orders([order_data])
+        except DatabaseError:
+            failed_tickets.append(order_data['intake_ticket'])
+        else:
+            created_orders[order.intake_ticket] = order.id
+    return created_orders, failed_tickets
+
+
+def drain_journal(batch_size):
+    """Переносит в базу до `batch_size` заказов из журнала.
+
+    Заказы сохраняются одной транзакцией. Если она не прошла, они
+    сохраняются по одному, чтобы один сломанный заказ не держал
+    остальные. Каждая неудачная попытка сохранить заказ засчитывается,
+    даже если в пачке не сохранился ни один: иначе сломанные заказы
+    в начале очереди вечно держали бы остальные. Заказ, который
+    не сохранился `ORDER_INTAKE_MAX_ATTEMPTS` раз, получает статус
+    `failed` и больше не обрабатывается.
+    """
+    journal = get_journal()
+    entries = journal.execute(
+        '''SELECT ticket, payload, created_at FROM order_intake
+        WHERE status = 'pending' ORDER BY created_at LIMIT ?''',
+        (batch_size,),
+    ).fetchall()
+    if not entries:
+        return 0
+
+    # Заказ мог попасть в базу, а журнал — не успеть обновиться.
+    # Такие билеты не создаём повторно, а просто закрываем.
+    created_orders = dict(
+        Order.objects
+        .filter(intake_ticket__in=[ticket for ticket, _, _ in entries])
+        .values_list('intake_ticket', 'id')
+    )
+    payloads = {
+        ticket: json.loads(payload)
+        for ticket, payload, _ in entries
+        if ticket not in created_orders
+    }
+    context = {'products': fetch_products(payloads.values())}
+
+    rejected_orders = {}
+    valid_orders = []
+    for ticket, _, created_at in entries:
+        if ticket in created_orders:
+            continue
+        serializer = OrderSerializer(data=payloads[ticket], context=context)
+        if not serializer.is_valid():
+            rejected_orders[ticket] = serializer.errors
+            continue
+        valid_orders.append({
+            **serializer.validated_data,
+            'intake_ticket': ticket,
+            'created_at': datetime.fromtimestamp(created_at, tz=timezone.utc),
+        })
+
+    failed_tickets = []
+    try:
+        with transaction.atomic():
+            orders = create_orders(valid_orders)
+    except DatabaseError:
+        saved_orders, failed_tickets = create_orders_one_by_one(valid_orders)
+        created_orders.update(saved_orders)
+    else:
+        for order in orders:
+            created_orders[order.intake_ticket] = order.id
+
+    journal.execute('BEGIN IMMEDIATE')
+    try:
+        journal.executemany(
+            '''UPDATE order_intake SET status = 'created', order_id = ?
+            WHERE ticket = ?''',
+            [(order_id, ticket) for ticket, order_id in created_orders.items()],
+        )
+        journal.executemany(
+            '''UPDATE order_intake SET status = 'rejected', errors = ?
+            WHERE ticket = ?''',
+            [
+                (json.dumps(errors, ensure_ascii=False), ticket)
+                for ticket, errors in rejected_orders.items()
+            ],
+        )
+        journal.executemany(
+            '''UPDATE order_intake SET attempts = attempts + 1,
+                status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE status END,
+                errors = CASE WHEN attempts + 1 >= ? THEN ? ELSE errors END
+            WHERE ticket = ?''',
+            [
+                (
+                    settings.ORDER_INTAKE_MAX_ATTEMPTS,
+                    settings.ORDER_INTAKE_MAX_ATTEMPTS,
+                    json.dumps(SAVE_FAILED_ERRORS, ensure_ascii=False),
+                    ticket,
+                )
+                for ticket in failed_tickets
+            ],
+        )
+    except sqlite3.Error:
+        journal.execute('ROLLBACK')
+        raise
+    journal.execute('COMMIT')
+
+    return len(entries)
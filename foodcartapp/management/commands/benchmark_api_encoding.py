@@ -0,0 +1,61 @@
+import gzip
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.encoding import compress, dumps_json, dumps_orjson, dumps_pretty_json
+from foodcartapp.views import dump_products
+
+
+def measure(function, argument, repeat):
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        result = function(argument)
+    elapsed = (time.perf_counter() - started_at) / repeat
+    return result, elapsed
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает размер и скорость кодирования ответа /api/products/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument(
+            '--copies',
+            type=int,
+            default=1,
+            help='во сколько раз размножить каталог для замера',
+        )
+
+    def handle(self, *args, **options):
+        products = dump_products() * options['copies']
+        repeat = options['repeat']
+
+        encoders = [
+            ('indent=4 (как раньше)', dumps_pretty_json),
+            ('компактный json', dumps_json),
+        ]
+        try:
+            import orjson  # noqa: F401
+            encoders.append(('компактный orjson', dumps_orjson))
+        except ImportError:
+            self.stdout.write('orjson не установлен, пропускаю его')
+
+        self.stdout.write(f'Товаров: {len(products)}')
+        for name, encoder in encoders:
+            content, encoding_time = measure(encoder, products, repeat)
+            variants = compress(content)
+            sizes = ', '.join(
+                f'{encoding} {len(body)} Б'
+                for encoding, body in variants.items()
+            )
+            self.stdout.write(
+                f'{name}: {sizes}; кодирование {encoding_time * 1e6:.0f} мкс'
+            )
+
+        content = dumps_json(products)
+        _, gzip_time = measure(gzip.compress, content, repeat)
+        self.stdout.write(
+            f'gzip на каждый запрос: {gzip_time * 1e6:.0f} мкс, '
+            'готовый вариант из снимка: 0 мкс'
+        )
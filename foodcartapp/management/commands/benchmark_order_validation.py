@@ -0,0 +1,97 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from foodcartapp.models import Product
+from foodcartapp.order_validation import normalize_phonenumber, order_payload_validator
+from foodcartapp.serializers import OrderSerializer, fetch_products
+
+
+PHONENUMBER_FORMATS = [
+    '+7916{:07d}',
+    '+7 916 {:07d}',
+    '+7 (916) {:07d}',
+]
+
+
+def generate_phonenumber(number):
+    # У каждого заказа свой номер, как у настоящих клиентов,
+    # иначе быстрый валидатор мерил бы только попадания в свой кэш
+    return random.choice(PHONENUMBER_FORMATS).format(number)
+
+
+def generate_payloads(product_ids, count, basket_size):
+    payloads = []
+    for number in range(count):
+        basket = random.sample(product_ids, min(basket_size, len(product_ids)))
+        payloads.append({
+            'firstname': f'Имя {number}',
+            'lastname': 'Фамилия',
+            'phonenumber': generate_phonenumber(number),
+            'address': f'Москва, Новый Арбат, {number % 50 + 1}',
+            'products': [
+                {'product': product_id, 'quantity': random.randint(1, 3)}
+                for product_id in basket
+            ],
+        })
+    return payloads
+
+
+def validate_with_serializer(payloads):
+    valid = 0
+    for payload in payloads:
+        serializer = OrderSerializer(data=payload)
+        valid += serializer.is_valid()
+    return valid
+
+
+def validate_with_fast_validator(payloads):
+    valid = 0
+    for payload in payloads:
+        valid += order_payload_validator.validate(payload) is not None
+    return valid
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость OrderSerializer и быстрого валидатора заказов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--basket-size', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        product_ids = list(Product.objects.values_list('id', flat=True))
+        if not product_ids:
+            raise CommandError('В базе нет товаров для тестовых заказов.')
+        payloads = generate_payloads(
+            product_ids,
+            options['orders'],
+            options['basket_size'],
+        )
+
+        products = fetch_products(payloads)
+        for payload in payloads:
+            serializer = OrderSerializer(data=payload, context={'products': products})
+            serializer.is_valid()
+            fast_order = order_payload_validator.validate(payload, products)
+            if serializer.errors or fast_order is None:
+                raise CommandError(f'Валидаторы разошлись на заказе {payload}')
+
+        engines = [
+            ('OrderSerializer', validate_with_serializer),
+            ('быстрый валидатор', validate_with_fast_validator),
+        ]
+        for name, validate in engines:
+            # Сверка выше уже разобрала все номера, меряем на пустом кэше
+            normalize_phonenumber.cache_clear()
+            started_at = time.perf_counter()
+            validate(payloads)
+            elapsed = time.perf_counter() - started_at
+            self.stdout.write(
+                f'{name}: {elapsed:.3f} с, '
+                f'{len(payloads) / elapsed:.0f} заказов/с, '
+                f'{elapsed / len(payloads) * 1e6:.0f} мкс на заказ'
+            )
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError
+
+from foodcartapp.intake import drain_journal
+
+
+class Command(BaseCommand):
+    help = 'Переносит принятые заказы из журнала приёма в базу данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='сколько заказов сохранять в одной транзакции',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='не завершаться, а ждать новые заказы',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='пауза в секундах, когда журнал пуст',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            try:
+                drained = drain_journal(options['batch_size'])
+            except DatabaseError as error:
+                if not options['loop']:
+                    raise
+                self.stderr.write(f'Не удалось сохранить заказы: {error}')
+                drained = 0
+
+            total += drained
+            if drained:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(f'Обработано заказов: {total}')
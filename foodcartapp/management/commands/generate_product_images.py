@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.images import generate_image_variants
+from foodcartapp.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные копии и WebP-версии картинок товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='пересоздать копии и у товаров, где они уже есть',
+        )
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='')
+        if not options['all']:
+            products = products.filter(image_variants={})
+
+        updated_products = []
+        for product in products:
+            product.image_variants = generate_image_variants(product.image)
+            if product.image_variants:
+                updated_products.append(product)
+
+        Product.objects.bulk_update(updated_products, ['image_variants'])
+        self.stdout.write(f'Обработано картинок: {len(updated_products)}')
@@ -0,0 +1,158 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from foodcartapp.models import Order, Restaurant
+from geo.geocoder import get_geocoder
+from geo.models import AddressPoint
+
+
+class RateLimiter:
+    """Пропускает не больше `rate` вызовов в секунду на все потоки."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_call_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            call_at = max(now, self.next_call_at)
+            self.next_call_at = call_at + self.interval
+        time.sleep(call_at - now)
+
+
+def find_missing_addresses():
+    missing_addresses = set()
+    # Ненайденные адреса ищем снова, только когда подошёл их срок
+    known_points = AddressPoint.objects.filter(
+        Q(latitude__isnull=False) | Q(retry_after__gt=timezone.now()),
+    )
+    for model in [Order, Restaurant]:
+        known = known_points.filter(address=OuterRef('address'))
+        missing_addresses.update(
+            model.objects
+            .exclude(address='')
+            .exclude(Exists(known))
+            .values_list('address', flat=True)
+            .distinct()
+        )
+    return sorted(missing_addresses)
+
+
+def save_address_points(address_points):
+    AddressPoint.objects.bulk_create(
+        address_points,
+        update_conflicts=True,
+        unique_fields=['address'],
+        update_fields=['latitude', 'longitude', 'retry_after'],
+    )
+
+
+class Command(BaseCommand):
+    help = 'Геокодирует адреса заказов и ресторанов, которых ещё нет в AddressPoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='сколько запросов к Геокодеру выполнять одновременно',
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=10,
+            help='не больше стольких запросов в секунду, 0 — без ограничения',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='сколько найденных адресов сохранять за раз',
+        )
+
+    def geocode(self, address):
+        self.rate_limiter.wait()
+        return address, self.geocoder.fetch_coordinates(address)
+
+    def handle(self, *args, **options):
+        addresses = find_missing_addresses()
+        self.stdout.write(f'Адресов без координат: {len(addresses)}')
+        if not addresses:
+            return
+
+        self.geocoder = get_geocoder()
+        self.rate_limiter = RateLimiter(options['rate'])
+        batch_size = options['batch_size']
+        retry_after = timezone.now() + timedelta(seconds=settings.GEOCODER_RETRY_AFTER)
+        found = 0
+        failed = 0
+        batch = []
+        started_at = time.perf_counter()
+
+        executor = ThreadPoolExecutor(max_workers=options['workers'])
+        try:
+            futures = [executor.submit(self.geocode, address) for address in addresses]
+            for future in as_completed(futures):
+                address, coordinates = future.result()
+                if coordinates is None:
+                    batch.append(AddressPoint(address=address, retry_after=retry_after))
+                    failed += 1
+                else:
+                    lat, lon = coordinates
+                    batch.append(AddressPoint(address=address, latitude=lat, longitude=lon))
+                    found += 1
+                if len(batch) >= batch_size:
+                    save_address_points(batch)
+                    batch = []
+        except KeyboardInterrupt:
+            self.stderr.write('Прервано, сохраняем найденное. Запустите команду снова, чтобы продолжить.')
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            # Найденное сохраняется сразу, так что повторный запуск продолжит с оставшихся адресов
+            if batch:
+                save_address_points(batch)
+            close_old_connections()
+
+        located_restaurants = self.locate_restaurants()
+
+        elapsed = time.perf_counter() - started_at
+        processed = found + failed
+        stats = self.geocoder.get_stats()
+        average_latency = stats['total_seconds'] / stats['calls'] if stats['calls'] else 0
+        self.stdout.write(
+            f'Найдено: {found}, не найдено: {failed}, '
+            f'осталось: {len(addresses) - processed}\n'
+            f'Ресторанов с новыми координатами: {located_restaurants}\n'
+            f'Скорость: {processed / elapsed:.1f} адресов/с за {elapsed:.1f} с\n'
+            f'Геокодер: повторов {stats["retries"]}, '
+            f'среднее время ответа {average_latency:.3f} с, '
+            f'максимальное {stats["max_seconds"]:.3f} с'
+        )
+
+    def locate_restaurants(self):
+        restaurants = Restaurant.objects.filter(latitude__isnull=True).exclude(address='')
+        address_points = AddressPoint.objects.filter(
+            address__in=restaurants.values('address'),
+            latitude__isnull=False,
+        ).in_bulk(field_name='address')
+        located = 0
+        for restaurant in restaurants:
+            address_point = address_points.get(restaurant.address)
+            if address_point is None:
+                continue
+            restaurant.latitude = address_point.latitude
+            restaurant.longitude = address_point.longitude
+            # save() отправляет сигналы, и сетка ресторанов с кандидатами обновятся
+            restaurant.save()
+            located += 1
+        return located
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.candidates import REFRESH_CHUNK_SIZE, refresh_order_candidates
+from foodcartapp.models import Order, OrderCandidate
+
+
+class Command(BaseCommand):
+    help = 'Заново заполняет таблицу ресторанов-кандидатов для заказов без ресторана'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=REFRESH_CHUNK_SIZE,
+            help='сколько заказов пересчитывать за раз',
+        )
+
+    def handle(self, *args, **options):
+        started_at = time.perf_counter()
+        deleted, _ = (
+            OrderCandidate.objects
+            .filter(order__restaurant__isnull=False)
+            .delete()
+        )
+
+        order_ids = list(
+            Order.objects
+            .filter(restaurant__isnull=True)
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+        chunk_size = options['chunk_size']
+        for start in range(0, len(order_ids), chunk_size):
+            chunk_ids = order_ids[start:start + chunk_size]
+            refresh_order_candidates(Order.objects.filter(pk__in=chunk_ids))
+
+        self.stdout.write(
+            f'Пересчитано заказов: {len(order_ids)}, '
+            f'удалено строк у заказов с рестораном: {deleted}, '
+            f'за {time.perf_counter() - started_at:.1f} с'
+        )
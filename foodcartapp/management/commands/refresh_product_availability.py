@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+
+from foodcartapp.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает флаг Product.is_available по меню ресторанов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='только проверить флаг, ничего не меняя',
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            updated = Product.objects.refresh_availability()
+            self.stdout.write(f'Пересчитано товаров: {updated}')
+
+        stale_products = (
+            Product.objects
+            .with_actual_availability()
+            .exclude(is_available=F('actual_availability'))
+            .values_list('id', flat=True)
+        )
+        stale_ids = list(stale_products)
+        if stale_ids:
+            raise CommandError(
+                f'Флаг доступности неверен у товаров: {stale_ids}'
+            )
+        self.stdout.write('Флаг доступности совпадает с меню ресторанов')
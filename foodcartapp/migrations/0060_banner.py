@@ -0,0 +1,92 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:18
+
+from django.db import migrations, models
+
+BANNERS = [
+    ("Burger", "burger.jpg", "Tasty Burger at your door step"),
+    ("Spices", "food.jpg", "All Cuisines"),
+    ("New York", "tasty.jpg", "Food is incomplete without a tasty dessert"),
+]
+
+
+def fill_banners(apps, schema_editor):
+    Banner = apps.get_model("foodcartapp", "Banner")
+    # Картинки остаются в статике, в media ничего не копируется
+    Banner.objects.bulk_create(
+        Banner(title=title, static_image=filename, text=text, position=position)
+        for position, (title, filename, text) in enumerate(BANNERS)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("foodcartapp", "0059_product_image_variants"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Banner",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("title", models.CharField(max_length=50, verbose_name="заголовок")),
+                (
+                    "text",
+                    models.CharField(blank=True, max_length=200, verbose_name="текст"),
+                ),
+                (
+                    "image",
+                    models.ImageField(
+                        blank=True, upload_to="banners", verbose_name="картинка"
+                    ),
+                ),
+                (
+                    "static_image",
+                    models.CharField(
+                        blank=True,
+                        help_text="путь к файлу в статике сайта, если картинка не загружена",
+                        max_length=200,
+                        verbose_name="картинка из статики",
+                    ),
+                ),
+                (
+                    "position",
+                    models.PositiveSmallIntegerField(
+                        db_index=True, default=0, verbose_name="порядок"
+                    ),
+                ),
+                (
+                    "active_from",
+                    models.DateTimeField(
+                        blank=True,
+                        db_index=True,
+                        null=True,
+                        verbose_name="показывать с",
+                    ),
+                ),
+                (
+                    "active_until",
+                    models.DateTimeField(
+                        blank=True,
+                        db_index=True,
+                        null=True,
+                        verbose_name="показывать до",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "баннер",
+                "verbose_name_plural": "баннеры",
+                "ordering": ["position", "id"],
+            },
+        ),
+        migrations.RunPython(fill_banners, migrations.RunPython.noop),
+    ]
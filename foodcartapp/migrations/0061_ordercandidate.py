@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("foodcartapp", "0060_banner"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderCandidate",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "distance_km",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="расстояние, км"
+                    ),
+                ),
+                ("rank", models.PositiveSmallIntegerField(verbose_name="место")),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="candidates",
+                        to="foodcartapp.order",
+                        verbose_name="заказ",
+                    ),
+                ),
+                (
+                    "restaurant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="order_candidates",
+                        to="foodcartapp.restaurant",
+                        verbose_name="ресторан",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "ресторан-кандидат",
+                "verbose_name_plural": "рестораны-кандидаты",
+                "ordering": ["order", "rank"],
+                "unique_together": {("order", "restaurant")},
+            },
+        ),
+    ]
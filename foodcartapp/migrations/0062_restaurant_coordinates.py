@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:26
+
+from django.db import migrations, models
+
+
+def fill_coordinates(apps, schema_editor):
+    Restaurant = apps.get_model("foodcartapp", "Restaurant")
+    AddressPoint = apps.get_model("geo", "AddressPoint")
+    restaurants = list(Restaurant.objects.all())
+    address_points = AddressPoint.objects.filter(
+        address__in=[restaurant.address for restaurant in restaurants],
+    ).in_bulk(field_name="address")
+    for restaurant in restaurants:
+        address_point = address_points.get(restaurant.address)
+        if address_point:
+            restaurant.latitude = address_point.latitude
+            restaurant.longitude = address_point.longitude
+    Restaurant.objects.bulk_update(restaurants, ["latitude", "longitude"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("foodcartapp", "0061_ordercandidate"),
+        ("geo", "0002_alter_addresspoint_address"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="restaurant",
+            name="latitude",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=6,
+                max_digits=9,
+                null=True,
+                verbose_name="широта",
+            ),
+        ),
+        migrations.AddField(
+            model_name="restaurant",
+            name="longitude",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=6,
+                max_digits=9,
+                null=True,
+                verbose_name="долгота",
+            ),
+        ),
+        migrations.RunPython(fill_coordinates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("foodcartapp", "0062_restaurant_coordinates"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CatalogVersion",
+            fields=[
+                (
+                    "key",
+                    models.CharField(
+                        max_length=100,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ключ",
+                    ),
+                ),
+                ("version", models.CharField(max_length=32, verbose_name="версия")),
+            ],
+            options={
+                "verbose_name": "версия каталога",
+                "verbose_name_plural": "версии каталога",
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("foodcartapp", "0063_catalogversion"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="idempotencykey",
+            name="request_hash",
+            field=models.CharField(
+                blank=True,
+                help_text="SHA-256 тела запроса: с другим телом ключ использовать нельзя",
+                max_length=64,
+                verbose_name="хэш запроса",
+            ),
+        ),
+    ]
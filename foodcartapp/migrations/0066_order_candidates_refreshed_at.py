@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("foodcartapp", "0065_idempotencykey_request_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="candidates_refreshed_at",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text="когда в последний раз заполнялась таблица ресторанов-кандидатов",
+                null=True,
+                verbose_name="Рестораны пересчитаны",
+            ),
+        ),
+    ]
@@ -1,11 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.templatetags.static import static
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
-from django.db.models import F, Sum
+from django.db.models import Exists, F, Min, OuterRef, Prefetch, Q, Sum
 from django.utils import timezone
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from collections import defaultdict
 
 from phonenumber_field.modelfields import PhoneNumberField
 
+from .catalog import MENUS_VERSION_KEY, PRODUCTS_VERSION_KEY
+from .catalog import get_restaurant_menu_version_key
+from .catalog import schedule_catalog_version_bump
+from .images import get_srcset, get_variant_url
 from .validators import validate_positive
 
 
@@ -24,6 +33,20 @@ class Restaurant(models.Model):
         max_length=50,
         blank=True,
     )
+    latitude = models.DecimalField(
+        'широта',
+        max_digits=9,
+        decimal_places=6,
+        null=True,
+        blank=True,
+    )
+    longitude = models.DecimalField(
+        'долгота',
+        max_digits=9,
+        decimal_places=6,
+        null=True,
+        blank=True,
+    )
 
     class Meta:
         verbose_name = 'ресторан'
@@ -32,15 +55,74 @@ class Restaurant(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_location = tuple(
+            instance.__dict__.get(field) for field in ['address', 'latitude', 'longitude']
+        )
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.loaded_location = tuple(
+            self.__dict__.get(field) for field in ['address', 'latitude', 'longitude']
+        )
+
+    def get_location(self):
+        return self.address, self.latitude, self.longitude
+
+    def get_point(self):
+        if self.latitude is None or self.longitude is None:
+            return None
+        return float(self.latitude), float(self.longitude)
+
 
-class ProductQuerySet(models.QuerySet):
+class CatalogQuerySet(models.QuerySet):
+    """Сбрасывает снимок каталога при массовых изменениях без сигналов."""
+
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        schedule_catalog_version_bump(PRODUCTS_VERSION_KEY)
+        return rows
+
+    def bulk_create(self, *args, **kwargs):
+        objs = super().bulk_create(*args, **kwargs)
+        schedule_catalog_version_bump(PRODUCTS_VERSION_KEY)
+        return objs
+
+    def bulk_update(self, *args, **kwargs):
+        rows = super().bulk_update(*args, **kwargs)
+        schedule_catalog_version_bump(PRODUCTS_VERSION_KEY)
+        return rows
+
+
+class ProductQuerySet(CatalogQuerySet):
     def available(self):
-        products = (
-            RestaurantMenuItem.objects
-            .filter(availability=True)
-            .values_list('product')
+        return self.filter(is_available=True)
+
+    def with_actual_availability(self):
+        return self.annotate(
+            actual_availability=Exists(
+                RestaurantMenuItem.objects.filter(
+                    product=OuterRef('pk'),
+                    availability=True,
+                )
+            )
+        )
+
+    def refresh_availability(self):
+        # Флаг не входит в меню ресторанов, поэтому обходим
+        # CatalogQuerySet.update и не сбрасываем их снимки
+        return models.QuerySet.update(
+            self,
+            is_available=Exists(
+                RestaurantMenuItem.objects.filter(
+                    product=OuterRef('pk'),
+                    availability=True,
+                )
+            )
         )
-        return self.filter(pk__in=products)
 
 
 class ProductCategory(models.Model):
@@ -49,6 +131,8 @@ class ProductCategory(models.Model):
         max_length=50
     )
 
+    objects = CatalogQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'категория'
         verbose_name_plural = 'категории'
@@ -89,6 +173,19 @@ class Product(models.Model):
         max_length=200,
         blank=True,
     )
+    image_variants = models.JSONField(
+        'уменьшенные копии картинки',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
+    is_available = models.BooleanField(
+        'есть в продаже',
+        default=False,
+        db_index=True,
+        editable=False,
+        help_text='обновляется автоматически по меню ресторанов',
+    )
 
     objects = ProductQuerySet.as_manager()
 
@@ -99,6 +196,64 @@ class Product(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_image_name = instance.__dict__.get('image')
+        return instance
+
+    def get_image_url(self, size):
+        return get_variant_url(self.image.storage, self.image_variants, size)
+
+    def get_srcset(self, extension=None):
+        return get_srcset(self.image.storage, self.image_variants, extension)
+
+
+def refresh_menus(product_ids, restaurant_ids):
+    from .candidates import schedule_candidates_refresh
+    Product.objects.filter(pk__in=product_ids).refresh_availability()
+    schedule_catalog_version_bump(MENUS_VERSION_KEY, *[
+        get_restaurant_menu_version_key(restaurant_id)
+        for restaurant_id in restaurant_ids
+    ])
+    schedule_candidates_refresh(products__product_id__in=product_ids)
+
+
+class RestaurantMenuItemQuerySet(models.QuerySet):
+    """Обновляет доступность товаров и меню при массовых изменениях без сигналов."""
+
+    def update(self, **kwargs):
+        affected_items = list(self.values_list('product_id', 'restaurant_id'))
+        product_ids = {product_id for product_id, _ in affected_items}
+        restaurant_ids = {restaurant_id for _, restaurant_id in affected_items}
+        for field, ids in [('product', product_ids), ('restaurant', restaurant_ids)]:
+            value = kwargs.get(field, kwargs.get(f'{field}_id'))
+            if value is not None:
+                ids.add(getattr(value, 'pk', value))
+        rows = super().update(**kwargs)
+        refresh_menus(product_ids, restaurant_ids)
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        refresh_menus(
+            {item.product_id for item in objs},
+            {item.restaurant_id for item in objs},
+        )
+        return objs
+
+    def bulk_update(self, objs, *args, **kwargs):
+        objs = list(objs)
+        rows = super().bulk_update(objs, *args, **kwargs)
+        product_ids = set()
+        restaurant_ids = set()
+        for item in objs:
+            item_product_ids, item_restaurant_ids = item.get_affected_ids()
+            product_ids.update(item_product_ids)
+            restaurant_ids.update(item_restaurant_ids)
+        refresh_menus(product_ids, restaurant_ids)
+        return rows
+
 
 class RestaurantMenuItem(models.Model):
     restaurant = models.ForeignKey(
@@ -119,6 +274,8 @@ class RestaurantMenuItem(models.Model):
         db_index=True
     )
 
+    objects = RestaurantMenuItemQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'пункт меню ресторана'
         verbose_name_plural = 'пункты меню ресторана'
@@ -129,6 +286,25 @@ class RestaurantMenuItem(models.Model):
     def __str__(self):
         return f"{self.restaurant.name} - {self.product.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_product_id = instance.__dict__.get('product_id')
+        instance.loaded_restaurant_id = instance.__dict__.get('restaurant_id')
+        return instance
+
+    def get_affected_ids(self):
+        """Товары и рестораны, которых могло коснуться сохранение пункта."""
+        product_ids = {self.product_id}
+        restaurant_ids = {self.restaurant_id}
+        loaded_product_id = getattr(self, 'loaded_product_id', None)
+        if loaded_product_id is not None:
+            product_ids.add(loaded_product_id)
+        loaded_restaurant_id = getattr(self, 'loaded_restaurant_id', None)
+        if loaded_restaurant_id is not None:
+            restaurant_ids.add(loaded_restaurant_id)
+        return product_ids, restaurant_ids
+
 
 class OrderQuerySet(models.QuerySet):
     def get_total_cost(self):
@@ -136,27 +312,13 @@ class OrderQuerySet(models.QuerySet):
             total_cost=Sum(F('products__quantity') * F('products__price'))
         ).prefetch_related('products__product')
 
-    def with_available_restaurants(self):
-        menu_items = (
-            RestaurantMenuItem.objects
-            .filter(availability=True)
-            .select_related('restaurant', 'product')
-        )
-        restaurant_menu = defaultdict(set)
-        for item in menu_items:
-            restaurant_menu[item.restaurant].add(item.product_id)
-
-        orders = list(self)
-        for order in orders:
-            order_products = set(order.products.values_list('product_id', flat=True))
-            available_restaurants = [
-                restaurant
-                for restaurant, product_ids in restaurant_menu.items()
-                if order_products.issubset(product_ids)
-            ]
-            order.available_restaurants = available_restaurants
-
-        return orders
+    def with_candidates(self):
+        """Подгружает рестораны-кандидаты из таблицы `OrderCandidate`."""
+        return self.prefetch_related(Prefetch(
+            'candidates',
+            queryset=OrderCandidate.objects.select_related('restaurant'),
+            to_attr='available_candidates',
+        ))
 
 
 class Order(models.Model):
@@ -200,6 +362,21 @@ class Order(models.Model):
     created_at = models.DateTimeField("Создано", default=timezone.now, db_index=True)
     called_at = models.DateTimeField("Принято", blank=True, null=True, db_index=True)
     delivered_at = models.DateTimeField("Доставлено", blank=True, null=True, db_index=True)
+    intake_ticket = models.CharField(
+        "Билет приёма",
+        max_length=32,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    candidates_refreshed_at = models.DateTimeField(
+        "Рестораны пересчитаны",
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="когда в последний раз заполнялась таблица ресторанов-кандидатов",
+    )
 
     objects = OrderQuerySet.as_manager()
 
@@ -235,3 +412,145 @@ class OrderedProduct(models.Model):
 
     def __str__(self):
         return f'{self.product.name} x {self.quantity}'
+
+
+class OrderCandidate(models.Model):
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.CASCADE,
+        related_name='candidates',
+        verbose_name='заказ',
+    )
+    restaurant = models.ForeignKey(
+        Restaurant,
+        on_delete=models.CASCADE,
+        related_name='order_candidates',
+        verbose_name='ресторан',
+    )
+    distance_km = models.FloatField('расстояние, км', null=True, blank=True)
+    rank = models.PositiveSmallIntegerField('место')
+
+    class Meta:
+        verbose_name = 'ресторан-кандидат'
+        verbose_name_plural = 'рестораны-кандидаты'
+        ordering = ['order', 'rank']
+        unique_together = [
+            ['order', 'restaurant']
+        ]
+
+    def __str__(self):
+        return f'{self.order} — {self.restaurant}'
+
+
+class IdempotencyKeyQuerySet(models.QuerySet):
+    def expired(self):
+        ttl = timedelta(seconds=settings.ORDER_IDEMPOTENCY_KEY_TTL)
+        return self.filter(created_at__lt=timezone.now() - ttl)
+
+
+class IdempotencyKey(models.Model):
+    key = models.CharField('ключ', max_length=64, unique=True)
+    request_hash = models.CharField(
+        'хэш запроса',
+        max_length=64,
+        blank=True,
+        help_text='SHA-256 тела запроса: с другим телом ключ использовать нельзя',
+    )
+    response_status = models.PositiveSmallIntegerField('код ответа')
+    response_data = models.JSONField('ответ', encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField('создан', default=timezone.now, db_index=True)
+
+    objects = IdempotencyKeyQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'ключ идемпотентности'
+        verbose_name_plural = 'ключи идемпотентности'
+
+    def __str__(self):
+        return self.key
+
+    def is_expired(self):
+        ttl = timedelta(seconds=settings.ORDER_IDEMPOTENCY_KEY_TTL)
+        return self.created_at < timezone.now() - ttl
+
+
+class CatalogVersion(models.Model):
+    key = models.CharField('ключ', max_length=100, primary_key=True)
+    version = models.CharField('версия', max_length=32)
+
+    class Meta:
+        verbose_name = 'версия каталога'
+        verbose_name_plural = 'версии каталога'
+
+    def __str__(self):
+        return f'{self.key}: {self.version}'
+
+
+class BannerQuerySet(models.QuerySet):
+    def active(self, now=None):
+        now = now or timezone.now()
+        return self.filter(
+            Q(active_from__isnull=True) | Q(active_from__lte=now),
+            Q(active_until__isnull=True) | Q(active_until__gt=now),
+        )
+
+    def get_next_change_at(self, now=None):
+        """Ближайший момент, когда какой-то баннер включится или выключится."""
+        now = now or timezone.now()
+        changes = self.aggregate(
+            next_start=Min('active_from', filter=Q(active_from__gt=now)),
+            next_end=Min('active_until', filter=Q(active_until__gt=now)),
+        )
+        return min(filter(None, changes.values()), default=None)
+
+
+class Banner(models.Model):
+    title = models.CharField('заголовок', max_length=50)
+    text = models.CharField('текст', max_length=200, blank=True)
+    image = models.ImageField('картинка', upload_to='banners', blank=True)
+    static_image = models.CharField(
+        'картинка из статики',
+        max_length=200,
+        blank=True,
+        help_text='путь к файлу в статике сайта, если картинка не загружена',
+    )
+    position = models.PositiveSmallIntegerField(
+        'порядок',
+        default=0,
+        db_index=True,
+    )
+    active_from = models.DateTimeField(
+        'показывать с',
+        null=True,
+        blank=True,
+        db_index=True,
+    )
+    active_until = models.DateTimeField(
+        'показывать до',
+        null=True,
+        blank=True,
+        db_index=True,
+    )
+
+    objects = BannerQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'баннер'
+        verbose_name_plural = 'баннеры'
+        ordering = ['position', 'id']
+
+    def __str__(self):
+        return self.title
+
+    def get_image_url(self):
+        if self.image:
+            return self.image.url
+        return static(self.static_image)
+
+    def clean(self):
+        if not self.image and not self.static_image:
+            raise ValidationError({'image': 'Загрузите картинку или укажите файл из статики.'})
+        if self.active_from and self.active_until and self.active_from >= self.active_until:
+            raise ValidationError({
+                'active_until': 'Баннер должен выключаться позже, чем включается.',
+            })
@@ -0,0 +1,118 @@
+from collections.abc import Mapping
+from functools import lru_cache
+
+from django.conf import settings
+from phonenumber_field.phonenumber import PhoneNumber, to_python
+
+from .models import Order
+from .serializers import fetch_products
+
+
+MAX_QUANTITY = 2 ** 31 - 1
+
+
+@lru_cache(maxsize=settings.ORDER_PHONENUMBER_CACHE_SIZE)
+def normalize_phonenumber(value):
+    phone_number = to_python(value)
+    if not isinstance(phone_number, PhoneNumber) or not phone_number.is_valid():
+        return None
+    return phone_number.as_e164
+
+
+def clean_text(value, max_length):
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    if not value or len(value) > max_length or '\x00' in value:
+        return None
+    try:
+        value.encode('utf-8')
+    except UnicodeEncodeError:
+        return None
+    return value
+
+
+def clean_integer(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.isascii() and value.isdigit():
+        return int(value)
+    return None
+
+
+class OrderPayloadValidator:
+    """Быстрая проверка заказа без `OrderSerializer`.
+
+    Пропускает только заведомо корректные заказы. Если хоть что-то
+    вызывает сомнение, `validate` возвращает None, и заказ проверяет
+    `OrderSerializer` — так ошибки клиенту приходят прежние.
+    """
+
+    text_fields = ['firstname', 'lastname', 'address']
+
+    def __init__(self):
+        self.max_lengths = {
+            field: Order._meta.get_field(field).max_length
+            for field in self.text_fields
+        }
+
+    def validate(self, data, products=None):
+        if not isinstance(data, Mapping):
+            return None
+        if products is None:
+            products = fetch_products([data])
+
+        order_data = {}
+        for field, max_length in self.max_lengths.items():
+            value = clean_text(data.get(field), max_length)
+            if value is None:
+                return None
+            order_data[field] = value
+
+        phonenumber = data.get('phonenumber')
+        if not isinstance(phonenumber, str):
+            return None
+        phonenumber = normalize_phonenumber(phonenumber.strip())
+        if phonenumber is None:
+            return None
+        order_data['phonenumber'] = phonenumber
+
+        products_data = data.get('products')
+        if not isinstance(products_data, list) or not products_data:
+            return None
+        order_data['products'] = []
+        for product_item in products_data:
+            if not isinstance(product_item, Mapping):
+                return None
+            product_id = clean_integer(product_item.get('product'))
+            quantity = clean_integer(product_item.get('quantity'))
+            if product_id not in products:
+                return None
+            if quantity is None or not 0 < quantity <= MAX_QUANTITY:
+                return None
+            order_data['products'].append({
+                'product': products[product_id],
+                'quantity': quantity,
+            })
+
+        return order_data
+
+    def to_representation(self, order_data):
+        return {
+            'firstname': order_data['firstname'],
+            'lastname': order_data['lastname'],
+            'phonenumber': order_data['phonenumber'],
+            'address': order_data['address'],
+            'products': [
+                {
+                    'product': product_item['product'].id,
+                    'quantity': product_item['quantity'],
+                }
+                for product_item in order_data['products']
+            ],
+        }
+
+
+order_payload_validator = OrderPayloadValidator()
@@ -0,0 +1,218 @@
+import heapq
+import re
+import threading
+from bisect import bisect_left
+
+from .catalog import get_catalog_version
+
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+FIELD_WEIGHTS = {
+    'name': 3,
+    'category': 2,
+    'description': 1,
+}
+EXACT_MATCH = 1
+PREFIX_MATCH = 0.7
+TYPO_MATCH = 0.4
+MIN_TYPO_LENGTH = 4
+
+
+def normalize(text):
+    return text.casefold().replace('ё', 'е')
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(normalize(text))
+
+
+def get_deletes(token):
+    return {token[:index] + token[index + 1:] for index in range(len(token))}
+
+
+def tokenize_product(product):
+    """Веса токенов товара: токен берёт вес самого важного поля, где встретился."""
+    fields = {
+        'name': product.name,
+        'category': product.category.name if product.category else '',
+        'description': product.description,
+    }
+    token_weights = {}
+    for field, text in fields.items():
+        for token in tokenize(text):
+            token_weights[token] = max(token_weights.get(token, 0), FIELD_WEIGHTS[field])
+    return token_weights
+
+
+def get_signature(product):
+    return (
+        product.name,
+        product.description,
+        product.category.name if product.category else None,
+    )
+
+
+class ProductSearchIndex:
+    """Инвертированный индекс по названию, описанию и категории товаров.
+
+    Индекс не меняется после сборки: `update` возвращает новый, поэтому
+    запросы других потоков не видят его наполовину обновлённым.
+    """
+
+    def __init__(self):
+        self.tokenized_products = {}
+        self.products = {}
+        self.names = {}
+        self.postings = {}
+        self.tokens = []
+        self.deletes = {}
+
+    def update(self, products, dump_product):
+        """Индекс для `products`, собранный из этого.
+
+        Заново разбираются на токены и раскладываются по индексу только
+        добавленные, изменившиеся и исчезнувшие товары. Список токенов
+        и словарь опечаток пересчитываются, только если набор токенов
+        изменился, и только для изменившихся токенов.
+        """
+        index = ProductSearchIndex()
+        changed_postings = {}
+
+        def get_postings(token):
+            if token not in changed_postings:
+                changed_postings[token] = dict(self.postings.get(token, {}))
+            return changed_postings[token]
+
+        for product in products:
+            signature = get_signature(product)
+            cached = self.tokenized_products.get(product.id)
+            if cached and cached[0] == signature:
+                token_weights = cached[1]
+            else:
+                token_weights = tokenize_product(product)
+                for token in cached[1] if cached else ():
+                    get_postings(token).pop(product.id, None)
+                for token, weight in token_weights.items():
+                    get_postings(token)[product.id] = weight
+            index.tokenized_products[product.id] = (signature, token_weights)
+            index.products[product.id] = dump_product(product)
+            index.names[product.id] = normalize(product.name)
+
+        for product_id, (_, token_weights) in self.tokenized_products.items():
+            if product_id not in index.tokenized_products:
+                for token in token_weights:
+                    get_postings(token).pop(product_id, None)
+
+        if not changed_postings:
+            index.postings = self.postings
+            index.tokens = self.tokens
+            index.deletes = self.deletes
+            return index
+
+        index.postings = dict(self.postings)
+        added_tokens = []
+        removed_tokens = []
+        for token, token_postings in changed_postings.items():
+            if token_postings:
+                if token not in index.postings:
+                    added_tokens.append(token)
+                index.postings[token] = token_postings
+            elif token in index.postings:
+                del index.postings[token]
+                removed_tokens.append(token)
+
+        if not added_tokens and not removed_tokens:
+            index.tokens = self.tokens
+            index.deletes = self.deletes
+            return index
+
+        index.tokens = sorted(index.postings)
+        index.deletes = dict(self.deletes)
+        for token in removed_tokens:
+            if len(token) >= MIN_TYPO_LENGTH:
+                for deleted in get_deletes(token):
+                    similar_tokens = index.deletes[deleted] - {token}
+                    if similar_tokens:
+                        index.deletes[deleted] = similar_tokens
+                    else:
+                        del index.deletes[deleted]
+        for token in added_tokens:
+            if len(token) >= MIN_TYPO_LENGTH:
+                for deleted in get_deletes(token):
+                    index.deletes[deleted] = index.deletes.get(deleted, frozenset()) | {token}
+        return index
+
+    def find_tokens(self, term):
+        """Токены индекса, похожие на слово запроса, с коэффициентом совпадения."""
+        matches = {}
+        position = bisect_left(self.tokens, term)
+        while position < len(self.tokens) and self.tokens[position].startswith(term):
+            token = self.tokens[position]
+            matches[token] = EXACT_MATCH if token == term else PREFIX_MATCH
+            position += 1
+
+        if len(term) >= MIN_TYPO_LENGTH:
+            candidates = set(self.deletes.get(term, ()))
+            for deleted in get_deletes(term):
+                candidates.update(self.deletes.get(deleted, ()))
+                if deleted in self.postings:
+                    candidates.add(deleted)
+            for token in candidates:
+                matches.setdefault(token, TYPO_MATCH)
+        return matches
+
+    def search(self, query, limit):
+        scores = None
+        for term in set(tokenize(query)):
+            term_scores = {}
+            for token, factor in self.find_tokens(term).items():
+                for product_id, weight in self.postings[token].items():
+                    score = weight * factor
+                    if score > term_scores.get(product_id, 0):
+                        term_scores[product_id] = score
+
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    product_id: score + term_scores[product_id]
+                    for product_id, score in scores.items()
+                    if product_id in term_scores
+                }
+            if not scores:
+                return []
+
+        if not scores:
+            return []
+        ranked_ids = heapq.nsmallest(
+            limit,
+            scores,
+            key=lambda product_id: (-scores[product_id], self.names[product_id]),
+        )
+        return [self.products[product_id] for product_id in ranked_ids]
+
+
+class SearchIndexHolder:
+    """Держит индекс процесса и обновляет его при смене версии каталога.
+
+    При обновлении заново разбираются на токены только изменившиеся товары.
+    """
+
+    def __init__(self):
+        self.index = ProductSearchIndex()
+        self.version = None
+        self.lock = threading.Lock()
+
+    def get_index(self, load_products, dump_product):
+        version = get_catalog_version()
+        if self.version == version:
+            return self.index
+        with self.lock:
+            if self.version != version:
+                self.index = self.index.update(load_products(), dump_product)
+                self.version = version
+        return self.index
+
+
+search_index = SearchIndexHolder()
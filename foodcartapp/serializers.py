@@ -1,12 +1,96 @@
+from collections.abc import Mapping
+
 from rest_framework import serializers
 from rest_framework.serializers import PrimaryKeyRelatedField
 from phonenumber_field.modelfields import PhoneNumberField
 from .models import Order, OrderedProduct, Product
-from django.db import transaction
+from .candidates import schedule_candidates_refresh
+from .utils import schedule_geocoding
+from django.db import connections, transaction
+
+
+def collect_product_ids(orders_data):
+    product_ids = set()
+    for order_data in orders_data:
+        if not isinstance(order_data, Mapping):
+            continue
+        products = order_data.get('products')
+        if not isinstance(products, list):
+            continue
+        for product_item in products:
+            if not isinstance(product_item, Mapping):
+                continue
+            try:
+                product_ids.add(int(product_item.get('product')))
+            except (TypeError, ValueError):
+                continue
+    return product_ids
+
+
+def fetch_products(orders_data):
+    product_ids = collect_product_ids(orders_data)
+    if not product_ids:
+        return {}
+    return Product.objects.in_bulk(product_ids)
+
+
+@transaction.atomic
+def create_orders(orders_data):
+    orders = []
+    for order_data in orders_data:
+        order_fields = {
+            field: value
+            for field, value in order_data.items()
+            if field != 'products'
+        }
+        orders.append(Order(**order_fields))
+
+    if connections[Order.objects.db].features.can_return_rows_from_bulk_insert:
+        Order.objects.bulk_create(orders)
+        # bulk_create не отправляет post_save, поэтому ставим адреса в очередь сами
+        schedule_geocoding(order.address for order in orders)
+    else:
+        for order in orders:
+            order.save()
+
+    OrderedProduct.objects.bulk_create([
+        OrderedProduct(
+            order=order,
+            product=product_item['product'],
+            quantity=product_item['quantity'],
+            price=product_item['product'].price,
+        )
+        for order, order_data in zip(orders, orders_data)
+        for product_item in order_data['products']
+    ])
+    schedule_candidates_refresh(pk__in=[order.pk for order in orders])
+
+    return orders
+
+
+class ProductPrimaryKeyRelatedField(PrimaryKeyRelatedField):
+    """Ищет товар в словаре `products`, заранее загруженном в контекст."""
+
+    def to_internal_value(self, data):
+        products = self.context.get('products')
+        if products is None:
+            return super().to_internal_value(data)
+
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            product_id = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+        product = products.get(product_id)
+        if product is None:
+            self.fail('does_not_exist', pk_value=data)
+        return product
 
 
 class OrderedProductSerializer(serializers.ModelSerializer):
-    product = PrimaryKeyRelatedField(
+    product = ProductPrimaryKeyRelatedField(
         queryset=Product.objects.all()
     )
 
@@ -29,20 +113,10 @@ class OrderSerializer(serializers.ModelSerializer):
             'products'
         ]
 
-    @transaction.atomic
+    def to_internal_value(self, data):
+        if 'products' not in self.context:
+            self.context['products'] = fetch_products([data])
+        return super().to_internal_value(data)
+
     def create(self, validated_data):
-        products_data = validated_data.pop('products')
-        order = Order.objects.create(**validated_data)
-
-        for product_item in products_data:
-            product = product_item['product']
-            quantity = product_item['quantity']
-            
-            OrderedProduct.objects.create(
-                order=order,
-                product=product,
-                quantity=quantity,
-                price=product.price
-            )
-
-        return order
+        return create_orders([validated_data])[0]
@@ -0,0 +1,132 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .candidates import schedule_candidates_refresh
+from .catalog import BANNERS_VERSION_KEY, MENUS_VERSION_KEY, PRODUCTS_VERSION_KEY
+from .catalog import RESTAURANTS_VERSION_KEY, bump_versions, delete_versions
+from .catalog import get_restaurant_menu_version_key, schedule_catalog_version_bump
+from .images import images_executor, run_image_variants_refresh
+from .models import Banner, Order, OrderedProduct, Product, ProductCategory
+from .models import Restaurant, RestaurantMenuItem, refresh_menus
+from .utils import schedule_geocoding, schedule_restaurant_geocoding
+
+
+@receiver(post_save, sender=Order)
+def geocode_order_address(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and 'address' not in update_fields:
+        return
+    schedule_geocoding([instance.address])
+    schedule_candidates_refresh(pk=instance.pk)
+
+
+@receiver([post_save, post_delete], sender=OrderedProduct)
+def refresh_order_candidates(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    schedule_candidates_refresh(pk=instance.order_id)
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductCategory)
+def invalidate_catalog(sender, raw=False, **kwargs):
+    if raw:
+        return
+    schedule_catalog_version_bump(PRODUCTS_VERSION_KEY)
+
+
+@receiver(post_save, sender=Product)
+def keep_product_availability(sender, instance, raw=False, **kwargs):
+    # save() пишет все поля, и устаревший is_available в памяти
+    # перезаписал бы флаг, посчитанный по меню ресторанов
+    if raw:
+        return
+    Product.objects.filter(pk=instance.pk).refresh_availability()
+
+
+@receiver(post_save, sender=Product)
+def refresh_image_variants(sender, instance, raw=False, **kwargs):
+    if raw or not instance.image:
+        return
+    image_name = instance.image.name
+    if image_name == getattr(instance, 'loaded_image_name', None) and instance.image_variants:
+        return
+
+    # Pillow обрабатывает картинку секунды, поэтому не в запросе админки
+    product_id = instance.pk
+    transaction.on_commit(
+        lambda: images_executor.submit(run_image_variants_refresh, product_id, image_name)
+    )
+    instance.loaded_image_name = image_name
+
+
+@receiver([post_save, post_delete], sender=RestaurantMenuItem)
+def refresh_restaurant_menu(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_menus(*instance.get_affected_ids())
+    instance.loaded_product_id = instance.product_id
+    instance.loaded_restaurant_id = instance.restaurant_id
+
+
+def needs_geocoding(restaurant):
+    if not restaurant.address:
+        return False
+    if restaurant.get_point() is None:
+        return True
+    loaded_location = getattr(restaurant, 'loaded_location', None)
+    if loaded_location is None:
+        return False
+    # Координаты, заданные вместе с новым адресом, не перезаписываем
+    address, latitude, longitude = loaded_location
+    return (
+        address != restaurant.address
+        and (latitude, longitude) == (restaurant.latitude, restaurant.longitude)
+    )
+
+
+@receiver(post_save, sender=Restaurant)
+def geocode_restaurant_address(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or not needs_geocoding(instance):
+        return
+    if update_fields is not None and 'address' not in update_fields:
+        return
+    schedule_restaurant_geocoding(instance.pk, instance.address)
+
+
+@receiver(post_save, sender=Restaurant)
+def invalidate_restaurant_menu(sender, instance, raw=False, created=False, **kwargs):
+    if raw:
+        return
+    transaction.on_commit(lambda: bump_versions([
+        MENUS_VERSION_KEY,
+        RESTAURANTS_VERSION_KEY,
+        get_restaurant_menu_version_key(instance.pk),
+    ]))
+    # Пересчёт идёт после смены версий, чтобы взять свежую сетку ресторанов.
+    # Переехавший ресторан может оказаться ближе к любому открытому заказу.
+    location = instance.get_location()
+    if not created and location != getattr(instance, 'loaded_location', None):
+        schedule_candidates_refresh()
+    instance.loaded_location = location
+
+
+@receiver(post_delete, sender=Restaurant)
+def invalidate_restaurant_locations(sender, instance, **kwargs):
+    menu_version_key = get_restaurant_menu_version_key(instance.pk)
+
+    def invalidate():
+        bump_versions([RESTAURANTS_VERSION_KEY])
+        # Без версии меню API снова проверит, есть ли ресторан, и ответит 404
+        delete_versions([menu_version_key])
+
+    transaction.on_commit(invalidate)
+
+
+@receiver([post_save, post_delete], sender=Banner)
+def invalidate_banners(sender, raw=False, **kwargs):
+    if raw:
+        return
+    transaction.on_commit(lambda: bump_versions([BANNERS_VERSION_KEY]))
@@ -0,0 +1,151 @@
+import heapq
+import math
+import threading
+
+from .catalog import RESTAURANTS_VERSION_KEY, get_version
+from .distances import haversine
+
+
+CELL_SIZE = 0.05
+# Градус меридиана не короче 110,5 км, так оценка снизу остаётся честной
+MIN_KM_PER_DEGREE = 110.5
+
+
+def get_cell(point):
+    lat, lon = point
+    return math.floor(lat / CELL_SIZE), math.floor(lon / CELL_SIZE)
+
+
+def get_ring(center, ring):
+    """Ячейки на границе квадрата со стороной 2 * ring + 1 вокруг center."""
+    row, column = center
+    if ring == 0:
+        return [center]
+    cells = []
+    for offset in range(-ring, ring + 1):
+        cells.append((row - ring, column + offset))
+        cells.append((row + ring, column + offset))
+    for offset in range(-ring + 1, ring):
+        cells.append((row + offset, column - ring))
+        cells.append((row + offset, column + ring))
+    return cells
+
+
+class RestaurantLocations:
+    """Сетка из ячеек по CELL_SIZE градусов с ресторанами внутри.
+
+    Ближайшие рестораны ищутся по расширяющимся кольцам ячеек вокруг
+    точки, так что дальние города не просматриваются вовсе.
+    """
+
+    def __init__(self, points=None, cells=None):
+        self.points = points or {}
+        self.cells = cells or {}
+
+    def update(self, moved, removed=()):
+        """Новая сетка, где рестораны `moved` перенесены в новые точки, а `removed` убраны.
+
+        `moved` — словарь: id ресторана → (широта, долгота) или None,
+        если координаты неизвестны. Текущая сетка не меняется, и её можно
+        читать из других потоков.
+        """
+        points = dict(self.points)
+        cells = dict(self.cells)
+        for restaurant_id in [*moved, *removed]:
+            point = points.pop(restaurant_id, None)
+            if point is None:
+                continue
+            cell = get_cell(point)
+            cells[cell] = cells[cell] - {restaurant_id}
+            if not cells[cell]:
+                del cells[cell]
+        for restaurant_id, point in moved.items():
+            if point is None:
+                continue
+            points[restaurant_id] = point
+            cell = get_cell(point)
+            cells[cell] = cells.get(cell, frozenset()) | {restaurant_id}
+        return RestaurantLocations(points, cells)
+
+    def iter_nearest(self, point, max_distance=None):
+        """Рестораны от ближнего к дальнему: пары (id, расстояние в км)."""
+        if not self.cells:
+            return
+        center = get_cell(point)
+        max_ring = max(
+            max(abs(row - center[0]), abs(column - center[1]))
+            for row, column in self.cells
+        )
+        lat = abs(point[0])
+        nearest = []
+        for ring in range(max_ring + 1):
+            if 8 * ring > len(self.cells):
+                # Колец осталось больше, чем непустых ячеек: проще добрать всё разом
+                for cell, restaurant_ids in self.cells.items():
+                    if max(abs(cell[0] - center[0]), abs(cell[1] - center[1])) >= ring:
+                        for restaurant_id in restaurant_ids:
+                            distance = haversine(point, self.points[restaurant_id])
+                            heapq.heappush(nearest, (distance, restaurant_id))
+                break
+
+            for cell in get_ring(center, ring):
+                for restaurant_id in self.cells.get(cell, ()):
+                    distance = haversine(point, self.points[restaurant_id])
+                    heapq.heappush(nearest, (distance, restaurant_id))
+
+            # За пределами просмотренных колец рестораны не ближе этого
+            lon_scale = math.cos(math.radians(min(lat + (ring + 1) * CELL_SIZE, 89)))
+            reached = ring * CELL_SIZE * MIN_KM_PER_DEGREE * lon_scale
+            while nearest and nearest[0][0] <= reached:
+                distance, restaurant_id = heapq.heappop(nearest)
+                if max_distance is not None and distance > max_distance:
+                    return
+                yield restaurant_id, distance
+            if max_distance is not None and reached > max_distance:
+                return
+
+        while nearest:
+            distance, restaurant_id = heapq.heappop(nearest)
+            if max_distance is not None and distance > max_distance:
+                return
+            yield restaurant_id, distance
+
+
+class RestaurantLocationsHolder:
+    """Держит сетку процесса и при смене версии ресторанов переносит в ней
+    только рестораны с новыми координатами."""
+
+    def __init__(self):
+        self.locations = RestaurantLocations()
+        self.version = None
+        self.lock = threading.Lock()
+
+    def get_locations(self):
+        from .models import Restaurant
+
+        version = get_version(RESTAURANTS_VERSION_KEY)
+        if self.version == version:
+            return self.locations
+        with self.lock:
+            if self.version != version:
+                points = {
+                    restaurant_id: (float(lat), float(lon))
+                    for restaurant_id, lat, lon in (
+                        Restaurant.objects
+                        .filter(latitude__isnull=False, longitude__isnull=False)
+                        .values_list('id', 'latitude', 'longitude')
+                    )
+                }
+                self.locations = self.locations.update(
+                    {
+                        restaurant_id: point
+                        for restaurant_id, point in points.items()
+                        if self.locations.points.get(restaurant_id) != point
+                    },
+                    self.locations.points.keys() - points.keys(),
+                )
+                self.version = version
+        return self.locations
+
+
+restaurant_locations = RestaurantLocationsHolder()
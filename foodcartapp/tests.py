@@ -0,0 +1,809 @@
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from geopy.distance import distance as geodesic_distance
+from phonenumber_field.phonenumber import to_python
+
+from geo.models import AddressPoint
+
+from . import distances
+from .admission import acquire_slot, release_slot
+from .candidates import find_candidates, schedule_candidates_refresh
+from .catalog import schedule_catalog_version_bump
+from .distances import get_distance_matrix, haversine, haversine_matrix
+from .distances import haversine_matrix_python
+from .intake import SAVE_FAILED_ERRORS, drain_journal, enqueue_order, get_journal, get_ticket
+from .models import Banner, CatalogVersion, Order, Product, Restaurant, RestaurantMenuItem
+from .order_validation import order_payload_validator
+from .search import ProductSearchIndex
+from .serializers import OrderSerializer, create_orders
+from .utils import get_coordinates
+
+
+class IdempotentOrderIntakeTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+
+    def setUp(self):
+        journal_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(journal_dir.cleanup)
+        queue_settings = self.settings(
+            ORDER_INTAKE_QUEUE=True,
+            ORDER_INTAKE_JOURNAL=os.path.join(journal_dir.name, 'order_intake.sqlite3'),
+        )
+        queue_settings.enable()
+        self.addCleanup(queue_settings.disable)
+        self.payload = {
+            'firstname': 'Иван',
+            'lastname': 'Иванов',
+            'phonenumber': '+79001234567',
+            'address': 'Красная площадь, 1',
+            'products': [{'product': self.product.id, 'quantity': 1}],
+        }
+
+    def post_order(self, key, **fields):
+        return self.client.post(
+            '/api/order/',
+            {**self.payload, **fields},
+            content_type='application/json',
+            headers={'Idempotency-Key': key},
+        )
+
+    def count_journal_entries(self):
+        return get_journal().execute('SELECT COUNT(*) FROM order_intake').fetchone()[0]
+
+    def test_retry_gets_same_ticket(self):
+        first = self.post_order('key-1')
+        second = self.post_order('key-1')
+
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(self.count_journal_entries(), 1)
+
+    def test_concurrent_retry_before_key_is_saved(self):
+        # Параллельный запрос уже положил заказ в журнал, но ещё не сохранил ключ
+        ticket = enqueue_order(self.payload, 'key-1')
+
+        response = self.post_order('key-1')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {'ticket': ticket})
+        self.assertEqual(self.count_journal_entries(), 1)
+
+    def test_key_with_other_order_is_rejected(self):
+        self.post_order('key-1')
+
+        response = self.post_order('key-1', firstname='Пётр')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertNotIn('ticket', response.json())
+        self.assertEqual(self.count_journal_entries(), 1)
+
+    def test_key_with_other_order_is_rejected_before_key_is_saved(self):
+        enqueue_order({**self.payload, 'firstname': 'Пётр'}, 'key-1')
+
+        response = self.post_order('key-1')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.count_journal_entries(), 1)
+
+    @override_settings(ORDER_INTAKE_QUEUE=False)
+    def test_retry_creates_one_order(self):
+        first = self.post_order('key-1')
+        second = self.post_order('key-1')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(Order.objects.count(), 1)
+
+    @override_settings(ORDER_INTAKE_QUEUE=False)
+    def test_key_with_other_order_does_not_replay_it(self):
+        self.post_order('key-1')
+
+        response = self.post_order('key-1', firstname='Пётр')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertNotIn('Иван', response.content.decode())
+        self.assertEqual(Order.objects.count(), 1)
+
+
+@override_settings(GEOCODE_IN_BACKGROUND=False)
+class CandidatesRefreshTest(TestCase):
+    def test_refreshes_are_coalesced_per_commit(self):
+        with mock.patch('foodcartapp.candidates.refresh_open_orders_candidates') as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                schedule_candidates_refresh(pk=1)
+                schedule_candidates_refresh(products__product_id__in=[2])
+
+        refresh.assert_called_once_with(
+            Q(pk=1) | Q(products__product_id__in=[2]),
+            geocode=False,
+        )
+
+    def test_empty_filters_refresh_all_orders(self):
+        with mock.patch('foodcartapp.candidates.refresh_open_orders_candidates') as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                schedule_candidates_refresh(pk=1)
+                schedule_candidates_refresh()
+
+        refresh.assert_called_once_with(Q(), geocode=False)
+
+    def test_order_intake_does_not_wait_for_geocoder(self):
+        product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        payload = {
+            'firstname': 'Иван',
+            'lastname': 'Иванов',
+            'phonenumber': '+79001234567',
+            'address': 'Красная площадь, 1',
+            'products': [{'product': product.id, 'quantity': 1}],
+        }
+
+        with mock.patch('foodcartapp.utils.fetch_coordinates') as fetch:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/order/', payload, content_type='application/json')
+
+        self.assertEqual(response.status_code, 201)
+        fetch.assert_not_called()
+
+
+@override_settings(GEOCODE_IN_BACKGROUND=False, CANDIDATES_NEAREST_COUNT=2)
+class NearestCandidatesTest(TestCase):
+    def test_empty_basket_skips_restaurants_without_menu(self):
+        product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            cooking = Restaurant.objects.create(
+                name='С меню',
+                address='Ресторан, 1',
+                latitude=55.75,
+                longitude=37.61,
+            )
+            Restaurant.objects.create(
+                name='Без меню',
+                address='Ресторан, 2',
+                latitude=55.75,
+                longitude=37.62,
+            )
+            RestaurantMenuItem.objects.create(restaurant=cooking, product=product)
+        AddressPoint.objects.create(address='Красная площадь, 1', latitude=55.75, longitude=37.62)
+        # Заказ из админки без товаров
+        order = Order.objects.create(
+            firstname='Иван',
+            lastname='Иванов',
+            phonenumber='+79001234567',
+            address='Красная площадь, 1',
+        )
+
+        candidates = find_candidates([order])
+
+        self.assertEqual(
+            [candidate.restaurant for candidate in candidates[order.id]],
+            [cooking],
+        )
+
+
+class DistanceMatrixTest(SimpleTestCase):
+    origins = [(55.75, 37.62), (59.94, 30.31), (-33.87, 151.21)]
+    destinations = [(55.80, 37.50), (55.75, 37.61), (40.71, -74.01), (-33.87, 151.2)]
+
+    def assertMatrixAlmostEqual(self, matrix, expected):
+        self.assertEqual(len(matrix), len(expected))
+        for row, expected_row in zip(matrix, expected):
+            self.assertEqual(len(row), len(expected_row))
+            for value, expected_value in zip(row, expected_row):
+                self.assertAlmostEqual(value, expected_value, places=6)
+
+    def test_python_matrix_matches_haversine(self):
+        expected = [
+            [haversine(origin, destination) for destination in self.destinations]
+            for origin in self.origins
+        ]
+        with mock.patch('foodcartapp.distances.numpy', None):
+            matrix = haversine_matrix(self.origins, self.destinations)
+
+        self.assertMatrixAlmostEqual(matrix, expected)
+
+    @skipUnless(distances.numpy, 'NumPy не установлен')
+    def test_numpy_matrix_matches_python(self):
+        self.assertMatrixAlmostEqual(
+            haversine_matrix(self.origins, self.destinations),
+            haversine_matrix_python(self.origins, self.destinations),
+        )
+
+    def test_empty_inputs(self):
+        for numpy_module in [distances.numpy, None]:
+            with self.subTest(numpy=bool(numpy_module)):
+                with mock.patch('foodcartapp.distances.numpy', numpy_module):
+                    self.assertEqual(haversine_matrix([], self.destinations), [])
+                    self.assertEqual(haversine_matrix(self.origins, []), [[], [], []])
+
+    def test_precise_mode_refines_close_calls(self):
+        origin = (55.75, 37.62)
+        # Почти одинаково далеко по гаверсинусу: по меридиану и по параллели
+        destinations = [(55.84, 37.62), (55.75, 37.78), (56.75, 37.62)]
+
+        matrix = get_distance_matrix([origin], destinations, precise=True)
+
+        geodesic = [geodesic_distance(origin, point).km for point in destinations]
+        self.assertAlmostEqual(matrix[0][0], geodesic[0], places=6)
+        self.assertAlmostEqual(matrix[0][1], geodesic[1], places=6)
+        self.assertEqual(matrix[0][2], haversine(origin, destinations[2]))
+
+
+class AdmissionSlotTest(SimpleTestCase):
+    def setUp(self):
+        self.cache = caches['default']
+        self.cache.delete('slots')
+
+    def test_counter_does_not_go_below_zero(self):
+        self.assertTrue(acquire_slot(self.cache, 'slots', 1))
+        release_slot(self.cache, 'slots')
+        release_slot(self.cache, 'slots')
+
+        self.assertEqual(self.cache.get('slots'), 0)
+        self.assertTrue(acquire_slot(self.cache, 'slots', 1))
+        self.assertFalse(acquire_slot(self.cache, 'slots', 1))
+
+    def test_acquire_extends_counter_timeout(self):
+        with mock.patch.object(self.cache, 'touch', wraps=self.cache.touch) as touch:
+            acquire_slot(self.cache, 'slots', 2)
+            acquire_slot(self.cache, 'slots', 2)
+
+        self.assertEqual(touch.call_count, 2)
+
+
+class ProductSearchIndexTest(SimpleTestCase):
+    def make_product(self, product_id, name):
+        return SimpleNamespace(id=product_id, name=name, description='', category=None)
+
+    def build(self, index, products):
+        return index.update(products, lambda product: product.id)
+
+    def test_update_patches_changed_products(self):
+        burger = self.make_product(1, 'Чизбургер')
+        cola = self.make_product(2, 'Кола')
+        index = self.build(ProductSearchIndex(), [burger, cola])
+
+        updated = self.build(index, [self.make_product(1, 'Гамбургер')])
+
+        self.assertEqual(updated.search('гамбургер', 10), [1])
+        self.assertEqual(updated.search('чизбургер', 10), [])
+        self.assertEqual(updated.search('кола', 10), [])
+        self.assertEqual(updated.search('гамбургре', 10), [1])
+        # Старый индекс не меняется, пока им пользуются другие запросы
+        self.assertEqual(index.search('чизбургер', 10), [1])
+
+    def test_update_without_changes_reuses_index(self):
+        products = [self.make_product(1, 'Чизбургер')]
+        index = self.build(ProductSearchIndex(), products)
+
+        updated = self.build(index, products)
+
+        self.assertIs(updated.postings, index.postings)
+        self.assertIs(updated.deletes, index.deletes)
+
+
+class ProductListApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        Product.objects.filter(pk=cls.product.pk).update(is_available=True)
+
+    def test_unknown_params_return_full_list(self):
+        response = self.client.get('/api/products/', {'utm_source': 'mail'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(json.loads(response.content), list)
+
+    def test_limit_returns_page(self):
+        response = self.client.get('/api/products/', {'limit': 1})
+
+        page = json.loads(response.content)
+        self.assertEqual([product['id'] for product in page['results']], [self.product.id])
+
+    def test_steady_state_reads_version_once(self):
+        self.client.get('/api/products/')
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response.headers)
+
+    def test_shared_cache_serves_without_queries(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        shared_cache = {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': cache_dir.name,
+        }
+        with self.settings(
+            CACHES={**settings.CACHES, 'catalog': shared_cache},
+            CATALOG_CACHE='catalog',
+        ):
+            etag = self.client.get('/api/products/').headers['ETag']
+            with self.assertNumQueries(0):
+                response = self.client.get('/api/products/', headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                Product.objects.filter(pk=self.product.pk).update(name='Чизбургер')
+                schedule_catalog_version_bump()
+            response = self.client.get('/api/products/', headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200)
+
+    def test_invalid_cursor_is_rejected_before_etag_check(self):
+        etag = self.client.get('/api/products/', {'limit': 1}).headers['ETag']
+
+        response = self.client.get(
+            '/api/products/',
+            {'cursor': '!!!'},
+            headers={'If-None-Match': etag},
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+
+class BannerListApiTest(TestCase):
+    def get_titles(self):
+        response = self.client.get('/api/banners/')
+        return [banner['title'] for banner in json.loads(response.content)]
+
+    def test_scheduled_banner_appears_when_its_time_comes(self):
+        Banner.objects.all().delete()
+        now = timezone.now()
+        Banner.objects.create(title='Сейчас', static_image='burger.jpg')
+        Banner.objects.create(
+            title='Потом',
+            static_image='food.jpg',
+            active_from=now + timedelta(hours=1),
+        )
+
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            self.assertEqual(self.get_titles(), ['Сейчас'])
+        with mock.patch('django.utils.timezone.now', return_value=now + timedelta(hours=2)):
+            self.assertEqual(self.get_titles(), ['Сейчас', 'Потом'])
+
+    def test_response_has_last_modified(self):
+        response = self.client.get('/api/banners/')
+        self.assertIn('Last-Modified', response.headers)
+
+        response = self.client.get(
+            '/api/banners/',
+            headers={'If-Modified-Since': response.headers['Last-Modified']},
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class RestaurantMenuApiTest(TestCase):
+    def test_unknown_restaurant_gets_no_version(self):
+        response = self.client.get('/api/restaurants/404/menu/')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(CatalogVersion.objects.filter(key__contains=':404:').exists())
+
+    def test_deleted_restaurant_menu_is_not_served(self):
+        restaurant = Restaurant.objects.create(name='Ресторан')
+        url = f'/api/restaurants/{restaurant.id}/menu/'
+        etag = self.client.get(url).headers['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            restaurant.delete()
+
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(GEOCODE_IN_BACKGROUND=False)
+class RestaurantGeocodingTest(TestCase):
+    def save(self, restaurant):
+        with mock.patch('foodcartapp.utils.fetch_coordinates', return_value=('55.75', '37.61')):
+            with self.captureOnCommitCallbacks(execute=True):
+                restaurant.save()
+        restaurant.refresh_from_db()
+
+    def test_new_restaurant_is_geocoded(self):
+        restaurant = Restaurant(name='Ресторан', address='Красная площадь, 1')
+
+        self.save(restaurant)
+
+        self.assertEqual(restaurant.get_point(), (55.75, 37.61))
+
+    def test_coordinates_given_with_address_are_kept(self):
+        restaurant = Restaurant(
+            name='Ресторан',
+            address='Красная площадь, 1',
+            latitude=55.8,
+            longitude=37.5,
+        )
+
+        self.save(restaurant)
+
+        self.assertEqual(restaurant.get_point(), (55.8, 37.5))
+
+
+class AddressPointsTest(TestCase):
+    def test_not_found_address_is_not_requested_again(self):
+        with mock.patch('foodcartapp.utils.fetch_coordinates', return_value=None) as fetch:
+            get_coordinates(['Нигде, 1'])
+            coordinates = get_coordinates(['Нигде, 1'])
+
+        self.assertEqual(coordinates, {'Нигде, 1': None})
+        fetch.assert_called_once()
+
+    @override_settings(GEOCODER_RETRY_AFTER=0)
+    def test_not_found_address_is_retried_later(self):
+        with mock.patch('foodcartapp.utils.fetch_coordinates', return_value=None):
+            get_coordinates(['Красная площадь, 1'])
+        with mock.patch('foodcartapp.utils.fetch_coordinates', return_value=('55.75', '37.61')):
+            coordinates = get_coordinates(['Красная площадь, 1'])
+
+        self.assertEqual(coordinates, {'Красная площадь, 1': (55.75, 37.61)})
+
+    def test_render_path_does_not_geocode(self):
+        with mock.patch('foodcartapp.utils.fetch_coordinates') as fetch:
+            coordinates = get_coordinates(['Красная площадь, 1'], geocode=False)
+
+        self.assertEqual(coordinates, {'Красная площадь, 1': None})
+        fetch.assert_not_called()
+
+
+class OrderValidationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+
+    def make_payload(self, **fields):
+        payload = {
+            'firstname': 'Иван',
+            'lastname': 'Иванов',
+            'phonenumber': '+79001234567',
+            'address': 'Красная площадь, 1',
+            'products': [{'product': self.product.id, 'quantity': 1}],
+        }
+        payload.update(fields)
+        return payload
+
+    def normalize(self, order_data):
+        return {
+            **order_data,
+            'phonenumber': to_python(order_data['phonenumber']).as_e164,
+            'products': [
+                (product_item['product'].id, product_item['quantity'])
+                for product_item in order_data['products']
+            ],
+        }
+
+    def test_validator_agrees_with_serializer(self):
+        product_id = self.product.id
+        cases = [
+            (self.make_payload(), True),
+            (self.make_payload(phonenumber='+7 (900) 123-45-67'), True),
+            (self.make_payload(firstname='  Иван  '), True),
+            (self.make_payload(products=[{'product': str(product_id), 'quantity': '2'}]), True),
+            (self.make_payload(phonenumber='+7900'), False),
+            (self.make_payload(phonenumber=None), False),
+            (self.make_payload(firstname=''), False),
+            (self.make_payload(firstname='   '), False),
+            (self.make_payload(firstname='И' * 100), False),
+            (self.make_payload(address=['Красная площадь']), False),
+            (self.make_payload(products=[]), False),
+            (self.make_payload(products={'product': product_id, 'quantity': 1}), False),
+            (self.make_payload(products=[{'product': product_id + 1, 'quantity': 1}]), False),
+            (self.make_payload(products=[{'product': product_id, 'quantity': 0}]), False),
+            (self.make_payload(products=[{'product': product_id, 'quantity': -1}]), False),
+            (self.make_payload(products=[{'product': product_id, 'quantity': True}]), False),
+            (self.make_payload(products=[{'product': product_id}]), False),
+            ([], False),
+        ]
+        for payload, is_valid in cases:
+            with self.subTest(payload=payload):
+                serializer = OrderSerializer(data=payload)
+                order_data = order_payload_validator.validate(payload)
+
+                self.assertEqual(serializer.is_valid(), is_valid)
+                if not is_valid:
+                    self.assertIsNone(order_data)
+                    continue
+                self.assertIsNotNone(order_data)
+                self.assertEqual(
+                    self.normalize(order_data),
+                    self.normalize(serializer.validated_data),
+                )
+
+
+class ProductAvailabilityTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = Restaurant.objects.create(name='Ресторан')
+        cls.burger = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        cls.cola = Product.objects.create(name='Кола', price=50, image='cola.jpg')
+
+    def add_to_menu(self, product):
+        return RestaurantMenuItem.objects.create(restaurant=self.restaurant, product=product)
+
+    def assertAvailable(self, product, is_available):
+        product.refresh_from_db(fields=['is_available'])
+        self.assertIs(product.is_available, is_available)
+
+    def test_inline_save(self):
+        menu_item = self.add_to_menu(self.burger)
+        self.assertAvailable(self.burger, True)
+
+        menu_item.availability = False
+        menu_item.save()
+
+        self.assertAvailable(self.burger, False)
+
+    def test_queryset_update(self):
+        self.add_to_menu(self.burger)
+
+        RestaurantMenuItem.objects.filter(product=self.burger).update(availability=False)
+
+        self.assertAvailable(self.burger, False)
+
+    def test_bulk_update(self):
+        menu_items = RestaurantMenuItem.objects.bulk_create([
+            RestaurantMenuItem(restaurant=self.restaurant, product=self.burger),
+            RestaurantMenuItem(restaurant=self.restaurant, product=self.cola),
+        ])
+        self.assertAvailable(self.cola, True)
+
+        for menu_item in menu_items:
+            menu_item.availability = False
+        RestaurantMenuItem.objects.bulk_update(menu_items, ['availability'])
+
+        self.assertAvailable(self.burger, False)
+        self.assertAvailable(self.cola, False)
+
+    def test_delete(self):
+        menu_item = self.add_to_menu(self.burger)
+        self.add_to_menu(self.cola)
+
+        menu_item.delete()
+        RestaurantMenuItem.objects.filter(product=self.cola).delete()
+
+        self.assertAvailable(self.burger, False)
+        self.assertAvailable(self.cola, False)
+
+    def test_menu_item_moved_to_other_product(self):
+        menu_item = self.add_to_menu(self.burger)
+        menu_item = RestaurantMenuItem.objects.get(pk=menu_item.pk)
+
+        menu_item.product = self.cola
+        menu_item.save()
+
+        self.assertAvailable(self.burger, False)
+        self.assertAvailable(self.cola, True)
+
+    def test_stale_product_save_keeps_flag(self):
+        product = Product.objects.get(pk=self.burger.pk)
+        self.add_to_menu(self.burger)
+
+        product.name = 'Чизбургер'
+        product.save()
+
+        self.assertAvailable(product, True)
+
+    def test_check_command(self):
+        self.add_to_menu(self.burger)
+        Product.objects.filter(pk=self.burger.pk).update(is_available=False)
+
+        with self.assertRaisesMessage(CommandError, str(self.burger.pk)):
+            call_command('refresh_product_availability', '--check', stdout=StringIO())
+        self.assertAvailable(self.burger, False)
+
+        call_command('refresh_product_availability', stdout=StringIO())
+        call_command('refresh_product_availability', '--check', stdout=StringIO())
+        self.assertAvailable(self.burger, True)
+
+
+class OrderBasketQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = [
+            Product.objects.create(name=f'Бургер {number}', price=100, image='burger.jpg')
+            for number in range(10)
+        ]
+
+    def make_payload(self, product_ids):
+        return {
+            'firstname': 'Иван',
+            'lastname': 'Иванов',
+            'phonenumber': '+79001234567',
+            'address': 'Красная площадь, 1',
+            'products': [
+                {'product': product_id, 'quantity': 1}
+                for product_id in product_ids
+            ],
+        }
+
+    def count_queries(self, product_ids):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/api/order/',
+                self.make_payload(product_ids),
+                content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 201)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_basket_size(self):
+        product_ids = [product.id for product in self.products]
+        for fast_validation in [False, True]:
+            with self.subTest(fast_validation=fast_validation):
+                with self.settings(ORDER_FAST_VALIDATION=fast_validation):
+                    self.assertEqual(
+                        self.count_queries(product_ids[:1]),
+                        self.count_queries(product_ids),
+                    )
+
+    def test_unknown_product_gets_error_on_its_line(self):
+        unknown_id = max(product.id for product in self.products) + 1
+        serializer = OrderSerializer(data=self.make_payload([self.products[0].id, unknown_id]))
+
+        self.assertFalse(serializer.is_valid())
+        product_errors = serializer.errors['products']
+        self.assertEqual(product_errors[0], {})
+        self.assertEqual(product_errors[1]['product'][0].code, 'does_not_exist')
+
+
+class OrdersBatchApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+
+    def make_order(self, firstname='Иван'):
+        return {
+            'firstname': firstname,
+            'lastname': 'Иванов',
+            'phonenumber': '+79001234567',
+            'address': 'Красная площадь, 1',
+            'products': [{'product': self.product.id, 'quantity': 1}],
+        }
+
+    def post_batch(self, orders_data):
+        return self.client.post('/api/orders/batch/', orders_data, content_type='application/json')
+
+    def test_results_follow_input_order(self):
+        orders_data = [
+            self.make_order('Иван'),
+            self.make_order(''),
+            'не заказ',
+            self.make_order('Пётр'),
+        ]
+        for fast_validation in [False, True]:
+            with self.subTest(fast_validation=fast_validation):
+                Order.objects.all().delete()
+                with self.settings(ORDER_FAST_VALIDATION=fast_validation):
+                    response = self.post_batch(orders_data)
+
+                self.assertEqual(response.status_code, 200)
+                results = response.json()
+                self.assertEqual(len(results), len(orders_data))
+                self.assertIn('firstname', results[1]['errors'])
+                self.assertIn('non_field_errors', results[2]['errors'])
+                orders = Order.objects.in_bulk([results[0]['id'], results[3]['id']])
+                self.assertEqual(orders[results[0]['id']].firstname, 'Иван')
+                self.assertEqual(orders[results[3]['id']].firstname, 'Пётр')
+                self.assertEqual(Order.objects.count(), 2)
+
+    @override_settings(ORDERS_BATCH_MAX_SIZE=2)
+    def test_too_large_batch_is_rejected(self):
+        response = self.post_batch([self.make_order()] * 3)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('orders', response.json())
+        self.assertFalse(Order.objects.exists())
+
+    def test_not_a_list_is_rejected(self):
+        for orders_data in [[], self.make_order()]:
+            with self.subTest(orders_data=orders_data):
+                response = self.post_batch(orders_data)
+
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('orders', response.json())
+
+    @override_settings(ORDERS_BATCH_CHUNK_SIZE=1)
+    def test_failed_chunk_does_not_drop_others(self):
+        def create_orders_or_fail(orders_data):
+            if any(order_data['firstname'] == 'Сломанный' for order_data in orders_data):
+                raise DatabaseError('сломанный заказ')
+            return create_orders(orders_data)
+
+        create = mock.Mock(side_effect=create_orders_or_fail)
+        with mock.patch('foodcartapp.views.create_orders', create):
+            response = self.post_batch([
+                self.make_order('Иван'),
+                self.make_order('Сломанный'),
+                self.make_order('Пётр'),
+            ])
+
+        self.assertEqual(create.call_count, 3)
+        results = response.json()
+        self.assertIn('id', results[0])
+        self.assertEqual(results[1], {'errors': SAVE_FAILED_ERRORS})
+        self.assertIn('id', results[2])
+        self.assertEqual(
+            list(Order.objects.order_by('id').values_list('firstname', flat=True)),
+            ['Иван', 'Пётр'],
+        )
+
+
+class DrainJournalTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+
+    def setUp(self):
+        journal_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(journal_dir.cleanup)
+        journal_settings = self.settings(
+            ORDER_INTAKE_JOURNAL=os.path.join(journal_dir.name, 'order_intake.sqlite3'),
+            ORDER_INTAKE_MAX_ATTEMPTS=2,
+        )
+        journal_settings.enable()
+        self.addCleanup(journal_settings.disable)
+
+    def enqueue(self, firstname):
+        return enqueue_order({
+            'firstname': firstname,
+            'lastname': 'Иванов',
+            'phonenumber': '+79001234567',
+            'address': 'Красная площадь, 1',
+            'products': [{'product': self.product.id, 'quantity': 1}],
+        })
+
+    def drain(self, batch_size=10):
+        def create_orders_or_fail(orders_data):
+            if any(order_data['firstname'] == 'Сломанный' for order_data in orders_data):
+                raise DatabaseError('сломанный заказ')
+            return create_orders(orders_data)
+
+        with mock.patch('foodcartapp.intake.create_orders', create_orders_or_fail):
+            drain_journal(batch_size)
+
+    def test_broken_order_does_not_block_others(self):
+        broken_ticket = self.enqueue('Сломанный')
+        ticket = self.enqueue('Иван')
+
+        self.drain()
+
+        self.assertEqual(get_ticket(ticket)['status'], 'created')
+        self.assertEqual(get_ticket(broken_ticket)['status'], 'pending')
+
+    def test_broken_order_fails_after_max_attempts(self):
+        broken_ticket = self.enqueue('Сломанный')
+        self.enqueue('Иван')
+
+        self.drain()
+        self.enqueue('Пётр')
+        self.drain()
+
+        ticket_info = get_ticket(broken_ticket)
+        self.assertEqual(ticket_info['status'], 'failed')
+        self.assertIn('non_field_errors', ticket_info['errors'])
+
+    def test_broken_head_of_queue_does_not_block_forever(self):
+        broken_tickets = [self.enqueue('Сломанный'), self.enqueue('Сломанный')]
+        ticket = self.enqueue('Иван')
+
+        for batch_size in [1, 1, 2, 1]:
+            self.drain(batch_size)
+
+        for broken_ticket in broken_tickets:
+            self.assertEqual(get_ticket(broken_ticket)['status'], 'failed')
+        self.assertEqual(get_ticket(ticket)['status'], 'created')
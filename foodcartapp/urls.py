@@ -1,12 +1,18 @@
 from django.urls import path
 
 from .views import product_list_api, banners_list_api, register_order
+from .views import register_orders_batch, order_ticket_status
+from .views import restaurant_menu_api, product_search_api
 
 
 app_name = "foodcartapp"
 
 urlpatterns = [
     path('products/', product_list_api),
+    path('products/search/', product_search_api),
     path('banners/', banners_list_api),
+    path('restaurants/<int:restaurant_id>/menu/', restaurant_menu_api),
     path('order/', register_order),
+    path('orders/batch/', register_orders_batch),
+    path('order/tickets/<str:ticket>/', order_ticket_status),
 ]
@@ -1,80 +1,155 @@
-import requests
+import logging
+from datetime import timedelta
 
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
-from requests.exceptions import HTTPError, RequestException
-from collections import defaultdict
-from geopy import distance
+from django.db import close_old_connections, transaction
+from django.utils import timezone
 
-from .models import RestaurantMenuItem
 
+logger = logging.getLogger(__name__)
 
-def fetch_coordinates(address):
-    base_url = "https://geocode-maps.yandex.ru/1.x"
-    params = {
-        "geocode": address,
-        "apikey": settings.YANDEX_API_KEY,
-        "format": "json"
-    }
-    try:
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()
-        found_places = response.json()['response']['GeoObjectCollection'][
-            'featureMember']
-        most_relevant = found_places[0]
-        lon, lat = most_relevant['GeoObject']['Point']['pos'].split(" ")
-        return lat, lon
-    except (HTTPError, KeyError, ValueError, RequestException):
-        return None
-
-
-def get_address_point(address):
-    from geo.models import AddressPoint
-    address_point, created = AddressPoint.objects.get_or_create(
-        address=address
-    )
-    if created:
-        lat, lon = fetch_coordinates(address)
-        address_point.latitude = lat
-        address_point.longitude = lon
-        address_point.save()
+geocoding_executor = ThreadPoolExecutor(
+    max_workers=1,
+    thread_name_prefix='geocoding',
+)
 
-    return address_point.latitude, address_point.longitude
+
+def fetch_coordinates(address):
+    from geo.geocoder import get_geocoder
+    return get_geocoder().fetch_coordinates(address)
 
 
-def get_distance(order, restaurant):
-    order_point = get_address_point(order.address)
-    restaurant_point = get_address_point(restaurant.address)
-    distance_between = distance.distance(order_point, restaurant_point).km
-    return f'{distance_between:.3f} км'
+def get_address_points(addresses, max_workers=None, geocode=True):
+    """Точки `AddressPoint` для адресов: словарь адрес → точка.
 
+    Известные точки загружаются одним запросом. Остальные адреса
+    геокодируются, параллельно в `max_workers` потоков, и сохраняются
+    одним `bulk_create`. Адрес, который Геокодер не нашёл, сохраняется
+    без координат и ищется снова не раньше `GEOCODER_RETRY_AFTER` секунд.
 
-def get_available_restaurants_for_orders(orders):
-    menu_items = (
-        RestaurantMenuItem.objects
-        .filter(availability=True)
-        .select_related('restaurant', 'product')
+    С `geocode=False` Геокодер не вызывается: так можно звать функцию
+    при отрисовке страницы, где ждать ответа Геокодера нельзя.
+    """
+    from geo.models import AddressPoint
+    if max_workers is None:
+        max_workers = settings.GEOCODER_PARALLEL_REQUESTS
+    now = timezone.now()
+    addresses = {address for address in addresses if address}
+    address_points = AddressPoint.objects.filter(address__in=addresses).in_bulk(
+        field_name='address',
+    )
+    missing_addresses = sorted(
+        address for address in addresses
+        if address not in address_points or address_points[address].needs_geocoding(now)
+    )
+    if not missing_addresses or not geocode:
+        return address_points
+
+    if max_workers > 1 and len(missing_addresses) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            found_coordinates = list(executor.map(fetch_coordinates, missing_addresses))
+    else:
+        found_coordinates = [fetch_coordinates(address) for address in missing_addresses]
+
+    retry_after = now + timedelta(seconds=settings.GEOCODER_RETRY_AFTER)
+    new_points = [
+        AddressPoint(address=address, latitude=coordinates[0], longitude=coordinates[1])
+        if coordinates else
+        AddressPoint(address=address, retry_after=retry_after)
+        for address, coordinates in zip(missing_addresses, found_coordinates)
+    ]
+    AddressPoint.objects.bulk_create(
+        new_points,
+        update_conflicts=True,
+        unique_fields=['address'],
+        update_fields=['latitude', 'longitude', 'retry_after'],
+    )
+    for address_point in new_points:
+        address_points[address_point.address] = address_point
+    return address_points
+
+
+def get_coordinates(addresses, geocode=True):
+    """Координаты адресов: (широта, долгота) числами.
+
+    Адрес, который Геокодер не нашёл или который ещё не геокодирован
+    при `geocode=False`, получает None.
+    """
+    addresses = set(addresses)
+    address_points = get_address_points(addresses, geocode=geocode)
+    coordinates = {}
+    for address in addresses:
+        address_point = address_points.get(address)
+        if address_point is None or address_point.latitude is None:
+            coordinates[address] = None
+        else:
+            coordinates[address] = (
+                float(address_point.latitude),
+                float(address_point.longitude),
+            )
+    return coordinates
+
+
+def run_geocoding(addresses):
+    close_old_connections()
+    try:
+        get_address_points(addresses)
+    except Exception:
+        logger.exception('Не удалось геокодировать адреса %s', addresses)
+    finally:
+        close_old_connections()
+
+
+def schedule_geocoding(addresses):
+    """Геокодирует адреса в фоне после фиксации текущей транзакции."""
+    if not settings.GEOCODE_IN_BACKGROUND:
+        return
+    addresses = {address for address in addresses if address}
+    if not addresses:
+        return
+    transaction.on_commit(
+        lambda: geocoding_executor.submit(run_geocoding, addresses)
     )
 
-    restaurant_menu = defaultdict(set)
-    for item in menu_items:
-        restaurant_menu[item.restaurant].add(item.product_id)
-
-    for order in orders:
-        order_products = set(order.products.values_list('product_id', flat=True))
-        available_restaurants = []
-
-        for restaurant, products in restaurant_menu.items():
-            if order_products.issubset(products):
-                distance = get_distance(order, restaurant)
-                try:
-                    distance = float(str(distance).split()[0])
-                except (TypeError, ValueError, AttributeError):
-                    distance = None
-                available_restaurants.append((restaurant, distance))
-
-        order.available_restaurants = sorted(
-            available_restaurants,
-            key=lambda x: x[1] if x[1] is not None else 9999
-        )
 
-    return orders
+def locate_restaurant(restaurant_id, address):
+    """Сохраняет координаты ресторана, если его адрес не успел смениться.
+
+    Если Геокодер не нашёл новый адрес, старые координаты стираются:
+    расстояние до ресторана станет неизвестным, а не неверным.
+    """
+    from .models import Restaurant
+    address_point = get_address_points([address]).get(address)
+    restaurant = Restaurant.objects.filter(pk=restaurant_id, address=address).first()
+    if restaurant is None:
+        return
+    if address_point is None or address_point.latitude is None:
+        restaurant.latitude = restaurant.longitude = None
+    else:
+        restaurant.latitude = address_point.latitude
+        restaurant.longitude = address_point.longitude
+    if restaurant.get_location() == restaurant.loaded_location:
+        return
+    # save(), а не update(): сигналы обновят сетку ресторанов и кандидатов заказов
+    restaurant.save(update_fields=['latitude', 'longitude'])
+
+
+def run_restaurant_geocoding(restaurant_id, address):
+    close_old_connections()
+    try:
+        locate_restaurant(restaurant_id, address)
+    except Exception:
+        logger.exception('Не удалось геокодировать ресторан %s', restaurant_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_restaurant_geocoding(restaurant_id, address):
+    """Ищет координаты ресторана после фиксации текущей транзакции."""
+    if settings.GEOCODE_IN_BACKGROUND:
+        transaction.on_commit(
+            lambda: geocoding_executor.submit(run_restaurant_geocoding, restaurant_id, address)
+        )
+    else:
+        transaction.on_commit(lambda: locate_restaurant(restaurant_id, address))
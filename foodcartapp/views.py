@@ -1,68 +1,475 @@
-from django.http import JsonResponse
-from django.templatetags.static import static
+import hashlib
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 from rest_framework import status
 
-from .serializers import OrderSerializer
-from .models import Product
+from .serializers import OrderSerializer, create_orders, fetch_products
+from .admission import admission_control, get_order_client_keys
+from .catalog import BANNERS_VERSION_KEY, bump_versions, get_version
+from .catalog import catalog_etag, catalog_last_modified, get_snapshot
+from .catalog import get_request_catalog_version, get_restaurant_menu_version
+from .catalog import get_version_time
+from .encoding import compress, compress_fast, encode_json
+from .encoding import ENCODINGS, encoded_response, negotiate_encoding
+from .images import get_srcset
+from .intake import IdempotencyKeyReused, enqueue_order, get_ticket
+from .order_validation import order_payload_validator
+from .search import search_index
+from .models import Banner, IdempotencyKey, Product, Restaurant, RestaurantMenuItem
+
+
+def build_banner_list():
+    now = timezone.now()
+    banners = Banner.objects.active(now)
+    return {
+        'variants': compress(encode_json([
+            {
+                'title': banner.title,
+                'src': banner.get_image_url(),
+                'text': banner.text,
+            }
+            for banner in banners
+        ])),
+        'next_change_at': Banner.objects.get_next_change_at(now),
+    }
+
+
+def get_banner_list():
+    """Возвращает версию и снимок списка баннеров.
+
+    Снимок помнит, когда по расписанию включится или выключится следующий
+    баннер. Когда этот момент наступает, версия баннеров меняется, и все
+    процессы пересобирают снимок.
+    """
+    version = get_version(BANNERS_VERSION_KEY)
+    banner_list = get_snapshot('banner_list', build_banner_list, version)
+    next_change_at = banner_list['next_change_at']
+    if next_change_at and next_change_at <= timezone.now():
+        bump_versions([BANNERS_VERSION_KEY])
+        version = get_version(BANNERS_VERSION_KEY)
+        banner_list = get_snapshot('banner_list', build_banner_list, version)
+    return version, banner_list
+
+
+def get_request_banner_list(request):
+    if not hasattr(request, 'banner_list'):
+        request.banner_list = get_banner_list()
+    return request.banner_list
+
+
+def banner_list_etag(request):
+    version, _ = get_request_banner_list(request)
+    return f'{version}-{negotiate_encoding(request)}'
+
 
+def banner_list_last_modified(request):
+    version, _ = get_request_banner_list(request)
+    return get_version_time(version)
 
+
+@admission_control('catalog')
+@cache_control(no_cache=True)
+@condition(etag_func=banner_list_etag, last_modified_func=banner_list_last_modified)
 def banners_list_api(request):
-    # FIXME move data to db?
-    return JsonResponse([
-        {
-            'title': 'Burger',
-            'src': static('burger.jpg'),
-            'text': 'Tasty Burger at your door step',
-        },
-        {
-            'title': 'Spices',
-            'src': static('food.jpg'),
-            'text': 'All Cuisines',
-        },
-        {
-            'title': 'New York',
-            'src': static('tasty.jpg'),
-            'text': 'Food is incomplete without a tasty dessert',
-        }
-    ], safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-    })
+    _, banner_list = get_request_banner_list(request)
+    return encoded_response(request, banner_list['variants'])
 
 
-def product_list_api(request):
+def dump_product(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': product.price,
+        'special_status': product.special_status,
+        'description': product.description,
+        'category': {
+            'id': product.category.id,
+            'name': product.category.name,
+        } if product.category else None,
+        'image': product.image.url,
+        'srcset': product.get_srcset(),
+        'srcset_webp': product.get_srcset('webp'),
+    }
+
+
+def dump_products():
     products = Product.objects.select_related('category').available()
 
     dumped_products = []
     for product in products:
-        dumped_product = {
+        dumped_product = dump_product(product)
+        dumped_product['restaurant'] = {
             'id': product.id,
             'name': product.name,
-            'price': product.price,
-            'special_status': product.special_status,
-            'description': product.description,
-            'category': {
-                'id': product.category.id,
-                'name': product.category.name,
-            } if product.category else None,
-            'image': product.image.url,
-            'restaurant': {
-                'id': product.id,
-                'name': product.name,
-            }
         }
         dumped_products.append(dumped_product)
-    return JsonResponse(dumped_products, safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
+    return dumped_products
+
+
+def build_product_list():
+    return compress(encode_json(dump_products()))
+
+
+PRODUCT_FIELDS = {
+    'id': ['id'],
+    'name': ['name'],
+    'price': ['price'],
+    'special_status': ['special_status'],
+    'description': ['description'],
+    'category': ['category_id', 'category__name'],
+    'image': ['image', 'image_variants'],
+    'restaurant': ['id', 'name'],
+}
+PRODUCTS_PAGE_SIZE = 50
+PRODUCTS_MAX_PAGE_SIZE = 200
+PRODUCTS_PAGE_PARAMS = {'limit', 'cursor', 'category', 'fields'}
+
+
+def encode_cursor(product_id):
+    return urlsafe_b64encode(str(product_id).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return int(urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeError):
+        raise ValidationError({'cursor': ['Некорректный курсор.']})
+
+
+def parse_product_page_params(params):
+    fields = list(PRODUCT_FIELDS)
+    if params.get('fields'):
+        requested_fields = set(params['fields'].split(','))
+        unknown_fields = requested_fields - set(PRODUCT_FIELDS)
+        if unknown_fields:
+            raise ValidationError({'fields': [
+                f'Неизвестные поля: {", ".join(sorted(unknown_fields))}.'
+            ]})
+        fields = [field for field in PRODUCT_FIELDS if field in requested_fields]
+
+    try:
+        limit = int(params.get('limit', PRODUCTS_PAGE_SIZE))
+        category_id = int(params['category']) if 'category' in params else None
+    except ValueError:
+        raise ValidationError({'detail': ['limit и category должны быть числами.']})
+    if not 0 < limit <= PRODUCTS_MAX_PAGE_SIZE:
+        raise ValidationError({'limit': [
+            f'Допустимо от 1 до {PRODUCTS_MAX_PAGE_SIZE}.'
+        ]})
+
+    after_id = decode_cursor(params['cursor']) if 'cursor' in params else None
+    return fields, limit, category_id, after_id
+
+
+def dump_product_row(row, fields):
+    image_storage = Product._meta.get_field('image').storage
+    dumped_product = {}
+    for field in fields:
+        if field == 'category':
+            dumped_product['category'] = {
+                'id': row['category_id'],
+                'name': row['category__name'],
+            } if row['category_id'] else None
+        elif field == 'image':
+            dumped_product['image'] = image_storage.url(row['image']) if row['image'] else None
+            dumped_product['srcset'] = get_srcset(image_storage, row['image_variants'])
+            dumped_product['srcset_webp'] = get_srcset(
+                image_storage,
+                row['image_variants'],
+                'webp',
+            )
+        elif field == 'restaurant':
+            dumped_product['restaurant'] = {
+                'id': row['id'],
+                'name': row['name'],
+            }
+        else:
+            dumped_product[field] = row[field]
+    return dumped_product
+
+
+def build_product_page(page_params):
+    fields, limit, category_id, after_id = page_params
+
+    products = Product.objects.available().order_by('id')
+    if category_id is not None:
+        products = products.filter(category_id=category_id)
+    if after_id is not None:
+        products = products.filter(id__gt=after_id)
+
+    columns = ['id']
+    for field in fields:
+        columns.extend(PRODUCT_FIELDS[field])
+    rows = list(products.values(*dict.fromkeys(columns))[:limit + 1])
+
+    next_cursor = encode_cursor(rows[limit - 1]['id']) if len(rows) > limit else None
+    return encode_json({
+        'results': [dump_product_row(row, fields) for row in rows[:limit]],
+        'next': next_cursor,
     })
 
 
-@api_view(['POST'])
-def register_order(request):
-    serializer = OrderSerializer(data=request.data)
+def is_product_page_request(request):
+    # Метки вроде utm_source или ?_= для сброса кэша не включают постраничный режим
+    return not PRODUCTS_PAGE_PARAMS.isdisjoint(request.GET)
+
+
+def product_list_etag(request, *args):
+    # Страницы каталога сжимаются на лету и только gzip
+    encodings = ['gzip'] if is_product_page_request(request) else ENCODINGS
+    return f'{catalog_etag(request)}-{negotiate_encoding(request, encodings)}'
+
+
+@condition(etag_func=product_list_etag, last_modified_func=catalog_last_modified)
+def product_page_response(request, page_params):
+    return encoded_response(request, compress_fast(build_product_page(page_params)))
+
+
+@condition(etag_func=product_list_etag, last_modified_func=catalog_last_modified)
+def product_list_response(request):
+    product_list = get_snapshot(
+        'product_list',
+        build_product_list,
+        get_request_catalog_version(request),
+    )
+    return encoded_response(request, product_list)
+
+
+@admission_control('catalog')
+@cache_control(no_cache=True)
+def product_list_api(request):
+    if not is_product_page_request(request):
+        return product_list_response(request)
+
+    # Параметры проверяются до ETag, иначе кривой курсор получил бы 304
+    try:
+        page_params = parse_product_page_params(request.GET)
+    except ValidationError as error:
+        return JsonResponse(error.detail, status=400, json_dumps_params={
+            'ensure_ascii': False,
+        })
+    return product_page_response(request, page_params)
+
+
+PRODUCT_SEARCH_LIMIT = 20
+
+
+def load_searchable_products():
+    return Product.objects.select_related('category').available()
+
+
+@admission_control('catalog')
+def product_search_api(request):
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse([], safe=False)
+    index = search_index.get_index(load_searchable_products, dump_product)
+    return JsonResponse(
+        index.search(query, PRODUCT_SEARCH_LIMIT),
+        safe=False,
+        json_dumps_params={'ensure_ascii': False},
+    )
+
+
+def build_restaurant_menu(restaurant_id):
+    restaurant = get_object_or_404(Restaurant, pk=restaurant_id)
+    menu_items = (
+        RestaurantMenuItem.objects
+        .filter(restaurant=restaurant)
+        .select_related('product__category')
+        .order_by('product_id')
+    )
+    dumped_menu_items = []
+    for menu_item in menu_items:
+        dumped_menu_item = dump_product(menu_item.product)
+        dumped_menu_item['availability'] = menu_item.availability
+        dumped_menu_items.append(dumped_menu_item)
+
+    return compress(encode_json({
+        'restaurant': {
+            'id': restaurant.id,
+            'name': restaurant.name,
+        },
+        'products': dumped_menu_items,
+    }))
+
+
+def get_request_menu_version(request, restaurant_id):
+    # ETag и снимок берут одну версию, и она запрашивается один раз
+    if not hasattr(request, 'restaurant_menu_version'):
+        request.restaurant_menu_version = get_restaurant_menu_version(restaurant_id)
+    if request.restaurant_menu_version is None:
+        raise Http404('Ресторан не найден.')
+    return request.restaurant_menu_version
+
+
+def restaurant_menu_etag(request, restaurant_id):
+    version = get_request_menu_version(request, restaurant_id)
+    return f'{version}-{negotiate_encoding(request)}'
+
+
+@admission_control('catalog')
+@cache_control(no_cache=True)
+@condition(etag_func=restaurant_menu_etag)
+def restaurant_menu_api(request, restaurant_id):
+    menu = get_snapshot(
+        f'restaurant_menu:{restaurant_id}',
+        lambda: build_restaurant_menu(restaurant_id),
+        get_request_menu_version(request, restaurant_id),
+    )
+    return encoded_response(request, menu)
+
+
+def accept_validated_order(order_data, idempotency_key=None):
+    order_representation = order_payload_validator.to_representation(order_data)
+    if settings.ORDER_INTAKE_QUEUE:
+        ticket = enqueue_order(order_representation, idempotency_key)
+        return Response({'ticket': ticket}, status=status.HTTP_202_ACCEPTED)
+    create_orders([order_data])
+    return Response(order_representation, status=status.HTTP_201_CREATED)
+
+
+def accept_order(data, idempotency_key=None):
+    if settings.ORDER_FAST_VALIDATION:
+        order_data = order_payload_validator.validate(data)
+        if order_data is not None:
+            return accept_validated_order(order_data, idempotency_key)
+
+    serializer = OrderSerializer(data=data)
     serializer.is_valid(raise_exception=True)
+    if settings.ORDER_INTAKE_QUEUE:
+        ticket = enqueue_order(serializer.data, idempotency_key)
+        return Response({'ticket': ticket}, status=status.HTTP_202_ACCEPTED)
     serializer.save()
     return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+def get_request_hash(data):
+    # Тело сравнивается после разбора JSON: пробелы и порядок ключей не важны
+    canonical_data = json.dumps(
+        data,
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(',', ':'),
+    )
+    return hashlib.sha256(canonical_data.encode()).hexdigest()
+
+
+def reused_key_response():
+    return Response(
+        {'Idempotency-Key': ['Ключ уже использован для другого заказа.']},
+        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+    )
+
+
+def replay_response(idempotency_key, request_hash):
+    if idempotency_key.request_hash and idempotency_key.request_hash != request_hash:
+        return reused_key_response()
+    return Response(
+        idempotency_key.response_data,
+        status=idempotency_key.response_status,
+    )
+
+
+@admission_control('order', get_order_client_keys)
+@api_view(['POST'])
+def register_order(request):
+    key = request.headers.get('Idempotency-Key')
+    if key is None:
+        return accept_order(request.data)
+
+    if not key or len(key) > IdempotencyKey._meta.get_field('key').max_length:
+        raise ValidationError({'Idempotency-Key': ['Некорректный ключ идемпотентности.']})
+
+    request_hash = get_request_hash(request.data)
+    idempotency_key = IdempotencyKey.objects.filter(key=key).first()
+    if idempotency_key and not idempotency_key.is_expired():
+        return replay_response(idempotency_key, request_hash)
+    if idempotency_key:
+        idempotency_key.delete()
+
+    try:
+        with transaction.atomic():
+            # Журнал приёма заказов не откатывается вместе с базой,
+            # поэтому ключ хранится и в нём: повтор получит тот же билет
+            response = accept_order(request.data, idempotency_key=key)
+            IdempotencyKey.objects.create(
+                key=key,
+                request_hash=request_hash,
+                response_status=response.status_code,
+                response_data=response.data,
+            )
+    except IdempotencyKeyReused:
+        return reused_key_response()
+    except IntegrityError:
+        # Параллельный повтор того же запроса успел сохранить свой ответ
+        idempotency_key = IdempotencyKey.objects.filter(key=key).first()
+        if idempotency_key is None:
+            raise
+        return replay_response(idempotency_key, request_hash)
+    return response
+
+
+@api_view(['GET'])
+def order_ticket_status(request, ticket):
+    ticket_info = get_ticket(ticket)
+    if ticket_info is None:
+        raise NotFound('Билет не найден.')
+    return Response(ticket_info)
+
+
+@admission_control('order', get_order_client_keys)
+@api_view(['POST'])
+def register_orders_batch(request):
+    orders_data = request.data
+    if not isinstance(orders_data, list) or not orders_data:
+        raise ValidationError({'orders': ['Ожидается непустой список заказов.']})
+    if len(orders_data) > settings.ORDERS_BATCH_MAX_SIZE:
+        raise ValidationError({'orders': [
+            f'Не больше {settings.ORDERS_BATCH_MAX_SIZE} заказов за один запрос.'
+        ]})
+
+    context = {'products': fetch_products(orders_data)}
+    results = [None] * len(orders_data)
+    valid_orders = []
+    for index, order_data in enumerate(orders_data):
+        if settings.ORDER_FAST_VALIDATION:
+            validated_order = order_payload_validator.validate(
+                order_data,
+                context['products'],
+            )
+            if validated_order is not None:
+                valid_orders.append((index, validated_order))
+                continue
+        serializer = OrderSerializer(data=order_data, context=context)
+        if serializer.is_valid():
+            valid_orders.append((index, serializer.validated_data))
+        else:
+            results[index] = {'errors': serializer.errors}
+
+    chunk_size = settings.ORDERS_BATCH_CHUNK_SIZE
+    for chunk_start in range(0, len(valid_orders), chunk_size):
+        chunk = valid_orders[chunk_start:chunk_start + chunk_size]
+        try:
+            orders = create_orders([order_data for _, order_data in chunk])
+        except DatabaseError:
+            for index, _ in chunk:
+                results[index] = {'errors': {
+                    'non_field_errors': ['Не удалось сохранить заказ.']
+                }}
+            continue
+        for (index, _), order in zip(chunk, orders):
+            results[index] = {'id': order.id}
+
+    return Response(results)
@@ -0,0 +1,123 @@
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class GeocoderClient:
+    """Клиент Яндекс Геокодера с общим пулом keep-alive соединений.
+
+    Каждый запрос ограничен таймаутами на соединение и на чтение.
+    Сетевые ошибки и ответы 429/5xx повторяются не больше `retries` раз
+    с экспоненциальной паузой и случайным разбросом, чтобы воркеры
+    не повторяли запросы хором.
+    """
+
+    def __init__(self, api_key, url, connect_timeout, read_timeout,
+                 retries, backoff, pool_size):
+        self.api_key = api_key
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            'calls': 0,
+            'failures': 0,
+            'retries': 0,
+            'total_seconds': 0.0,
+            'max_seconds': 0.0,
+        }
+
+    def get_delay(self, attempt):
+        return self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+
+    def request(self, address):
+        params = {
+            'geocode': address,
+            'apikey': self.api_key,
+            'format': 'json',
+        }
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                response = self.session.get(self.url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if last_attempt:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or last_attempt:
+                    response.raise_for_status()
+                    return response.json()
+            with self.stats_lock:
+                self.stats['retries'] += 1
+            time.sleep(self.get_delay(attempt))
+
+    def record_call(self, seconds, failed):
+        with self.stats_lock:
+            self.stats['calls'] += 1
+            self.stats['failures'] += failed
+            self.stats['total_seconds'] += seconds
+            self.stats['max_seconds'] = max(self.stats['max_seconds'], seconds)
+
+    def get_stats(self):
+        with self.stats_lock:
+            return dict(self.stats)
+
+    def fetch_coordinates(self, address):
+        """Возвращает (широта, долгота) строками или None, если адрес не найден."""
+        started_at = time.perf_counter()
+        coordinates = None
+        try:
+            found_places = self.request(address)['response']['GeoObjectCollection'][
+                'featureMember']
+            most_relevant = found_places[0]
+            lon, lat = most_relevant['GeoObject']['Point']['pos'].split(" ")
+            coordinates = lat, lon
+        except (requests.RequestException, KeyError, IndexError, ValueError) as error:
+            # Без traceback: в тексте ошибки requests есть URL с API-ключом
+            logger.warning('Геокодер не нашёл адрес %s: %s', address, type(error).__name__)
+        finally:
+            seconds = time.perf_counter() - started_at
+            self.record_call(seconds, coordinates is None)
+            logger.debug('Геокодер ответил за %.3f с: %s', seconds, address)
+        return coordinates
+
+
+clients = {}
+clients_lock = threading.Lock()
+
+
+def get_geocoder():
+    """Клиент текущего процесса. После fork воркер создаёт свой пул соединений."""
+    pid = os.getpid()
+    client = clients.get(pid)
+    if client is None:
+        with clients_lock:
+            client = clients.get(pid)
+            if client is None:
+                clients.clear()
+                client = clients[pid] = GeocoderClient(
+                    api_key=settings.YANDEX_API_KEY,
+                    url=settings.GEOCODER_URL,
+                    connect_timeout=settings.GEOCODER_CONNECT_TIMEOUT,
+                    read_timeout=settings.GEOCODER_READ_TIMEOUT,
+                    retries=settings.GEOCODER_RETRIES,
+                    backoff=settings.GEOCODER_BACKOFF,
+                    pool_size=settings.GEOCODER_POOL_SIZE,
+                )
+    return client
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("geo", "0002_alter_addresspoint_address"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="addresspoint",
+            name="retry_after",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="для адресов, которые Геокодер не нашёл",
+                null=True,
+                verbose_name="искать снова после",
+            ),
+        ),
+    ]
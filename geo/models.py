@@ -26,6 +26,18 @@ class AddressPoint(models.Model):
         'дата и время регистрации',
         default=timezone.now
     )
+    retry_after = models.DateTimeField(
+        'искать снова после',
+        null=True,
+        blank=True,
+        help_text='для адресов, которые Геокодер не нашёл',
+    )
     
     def __str__(self):
         return self.address
+
+    def needs_geocoding(self, now=None):
+        if self.latitude is not None:
+            return False
+        now = now or timezone.now()
+        return self.retry_after is None or self.retry_after <= now
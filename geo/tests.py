@@ -1,3 +1,82 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from .geocoder import GeocoderClient
+
+
+class StubGeocoderHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        status, delay = server.responses.pop(0) if server.responses else (200, 0)
+        time.sleep(delay)
+        body = json.dumps({'response': {'GeoObjectCollection': {'featureMember': [
+            {'GeoObject': {'Point': {'pos': '37.617635 55.755814'}}},
+        ]}}}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubGeocoderServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Клиент рвёт соединение по таймауту, это ожидаемо
+        pass
+
+
+class GeocoderClientTest(SimpleTestCase):
+    def setUp(self):
+        self.server = StubGeocoderServer(('127.0.0.1', 0), StubGeocoderHandler)
+        self.server.requests = 0
+        self.server.responses = []
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        host, port = self.server.server_address
+        self.client = GeocoderClient(
+            api_key='key',
+            url=f'http://{host}:{port}/1.x',
+            connect_timeout=1,
+            read_timeout=0.2,
+            retries=2,
+            backoff=0.01,
+            pool_size=2,
+        )
+        self.addCleanup(self.client.session.close)
+
+    def test_returns_coordinates(self):
+        coordinates = self.client.fetch_coordinates('Красная площадь, 1')
+
+        self.assertEqual(coordinates, ('55.755814', '37.617635'))
+        self.assertEqual(self.client.get_stats()['calls'], 1)
+
+    def test_retries_server_errors(self):
+        self.server.responses = [(503, 0), (500, 0)]
+
+        coordinates = self.client.fetch_coordinates('Красная площадь, 1')
+
+        self.assertEqual(coordinates, ('55.755814', '37.617635'))
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(self.client.get_stats()['retries'], 2)
+
+    def test_gives_up_after_timeouts(self):
+        self.server.responses = [(200, 0.5)] * 3
+
+        with self.assertLogs('geo.geocoder', 'WARNING') as logs:
+            coordinates = self.client.fetch_coordinates('Красная площадь, 1')
+
+        self.assertIsNone(coordinates)
+        stats = self.client.get_stats()
+        self.assertEqual(stats['failures'], 1)
+        self.assertLess(stats['max_seconds'], 1.5)
+        self.assertNotIn('apikey', '\n'.join(logs.output))
@@ -1,3 +1,157 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from foodcartapp.models import Order, OrderedProduct, Product, Restaurant
+from foodcartapp.models import RestaurantMenuItem
+from geo.models import AddressPoint
+
+
+@override_settings(GEOCODE_IN_BACKGROUND=False)
+class ViewOrdersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = get_user_model().objects.create_user(
+            'manager',
+            password='password',
+            is_staff=True,
+        )
+        cls.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        for number, (lat, lon) in enumerate([(55.75, 37.61), (55.80, 37.50)]):
+            restaurant = Restaurant.objects.create(
+                name=f'Ресторан {number}',
+                address=f'Ресторан, {number}',
+                latitude=lat,
+                longitude=lon,
+            )
+            RestaurantMenuItem.objects.create(restaurant=restaurant, product=cls.product)
+        AddressPoint.objects.create(address='Красная площадь, 1', latitude=55.75, longitude=37.62)
+
+    def setUp(self):
+        self.client.force_login(self.manager)
+
+    def create_orders(self, count):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.save_orders(count)
+
+    def save_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(
+                firstname='Иван',
+                lastname='Иванов',
+                phonenumber='+79001234567',
+                address='Красная площадь, 1',
+                payment='cash',
+            )
+            OrderedProduct.objects.create(
+                order=order,
+                product=self.product,
+                quantity=1,
+                price=self.product.price,
+            )
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('restaurateur:view_orders'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_order_count(self):
+        self.create_orders(2)
+        self.count_queries()
+        few_orders_queries = self.count_queries()
+
+        self.create_orders(20)
+        self.assertEqual(self.count_queries(), few_orders_queries)
+
+    def test_on_the_fly_query_count_does_not_depend_on_order_count(self):
+        # Заказы без строк в OrderCandidate считаются движком на лету
+        for nearest_count in [None, 2]:
+            with self.subTest(nearest_count=nearest_count):
+                Order.objects.all().delete()
+                with self.settings(CANDIDATES_NEAREST_COUNT=nearest_count):
+                    self.save_orders(2)
+                    self.count_queries()
+                    few_orders_queries = self.count_queries()
+
+                    self.save_orders(20)
+                    self.assertEqual(self.count_queries(), few_orders_queries)
+
+    def test_candidates_are_ranked_by_distance(self):
+        self.create_orders(1)
+        response = self.client.get(reverse('restaurateur:view_orders'))
+
+        order = response.context['order_items'][0]
+        names = [candidate.restaurant.name for candidate in order.available_candidates]
+        self.assertEqual(names, ['Ресторан 0', 'Ресторан 1'])
+        self.assertAlmostEqual(order.available_candidates[0].distance_km, 0.63, places=1)
+
+    @override_settings(CANDIDATES_NEAREST_COUNT=1)
+    def test_only_nearest_candidates_are_shown(self):
+        self.create_orders(1)
+        response = self.client.get(reverse('restaurateur:view_orders'))
+
+        order = response.context['order_items'][0]
+        names = [candidate.restaurant.name for candidate in order.available_candidates]
+        self.assertEqual(names, ['Ресторан 0'])
+
+    @override_settings(CANDIDATES_MAX_DISTANCE_KM=5)
+    def test_far_candidates_are_not_shown(self):
+        self.create_orders(1)
+        response = self.client.get(reverse('restaurateur:view_orders'))
+
+        order = response.context['order_items'][0]
+        self.assertEqual(len(order.available_candidates), 1)
+        self.assertLess(order.available_candidates[0].distance_km, 5)
+
+    def test_candidates_are_computed_for_orders_without_rows(self):
+        # Заказы, созданные до таблицы OrderCandidate
+        self.save_orders(1)
+
+        response = self.client.get(reverse('restaurateur:view_orders'))
+        order = response.context['order_items'][0]
+        names = [candidate.restaurant.name for candidate in order.available_candidates]
+        self.assertEqual(names, ['Ресторан 0', 'Ресторан 1'])
+
+    def test_orders_nobody_can_cook_are_not_recomputed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.save_orders(1)
+            RestaurantMenuItem.objects.update(availability=False)
+
+        with mock.patch('foodcartapp.candidates.find_candidates') as find_candidates:
+            response = self.client.get(reverse('restaurateur:view_orders'))
+
+        find_candidates.assert_not_called()
+        order = response.context['order_items'][0]
+        self.assertEqual(order.available_candidates, [])
+
+    @override_settings(CANDIDATES_MAX_DISTANCE_KM=5)
+    def test_restaurant_move_refreshes_all_open_orders(self):
+        self.create_orders(1)
+        restaurant = Restaurant.objects.get(name='Ресторан 1')
+        restaurant.address = 'Красная площадь, 1'
+        restaurant.latitude = 55.75
+        restaurant.longitude = 37.62
+        with self.captureOnCommitCallbacks(execute=True):
+            restaurant.save()
+
+        response = self.client.get(reverse('restaurateur:view_orders'))
+        order = response.context['order_items'][0]
+        names = [candidate.restaurant.name for candidate in order.available_candidates]
+        self.assertEqual(names, ['Ресторан 1', 'Ресторан 0'])
+
+    def test_candidates_follow_menu_changes(self):
+        self.create_orders(1)
+        with self.captureOnCommitCallbacks(execute=True):
+            RestaurantMenuItem.objects.filter(restaurant__name='Ресторан 0').update(
+                availability=False,
+            )
+
+        response = self.client.get(reverse('restaurateur:view_orders'))
+        order = response.context['order_items'][0]
+        names = [candidate.restaurant.name for candidate in order.available_candidates]
+        self.assertEqual(names, ['Ресторан 1'])
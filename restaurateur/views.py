@@ -6,8 +6,8 @@ from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
 
+from foodcartapp.candidates import attach_missing_candidates
 from foodcartapp.models import Product, Restaurant, Order
-from foodcartapp.utils import get_available_restaurants_for_orders
 
 
 class Login(forms.Form):
@@ -91,13 +91,12 @@ def view_restaurants(request):
 
 @user_passes_test(is_manager, login_url='restaurateur:login')
 def view_orders(request):
-    orders = (
+    orders = attach_missing_candidates(
         Order.objects
         .get_total_cost()
         .prefetch_related('products__product')
-        .with_available_restaurants()
+        .with_candidates()
     )
-    orders = get_available_restaurants_for_orders(orders)
 
     return render(request, 'order_items.html', {
         'order_items': orders,
@@ -16,9 +16,61 @@ SECRET_KEY = env('SECRET_KEY')
 DEBUG = env.bool('DEBUG', True)
 
 YANDEX_API_KEY = env('YANDEX_API_KEY')
+GEOCODER_URL = env('GEOCODER_URL', 'https://geocode-maps.yandex.ru/1.x')
+GEOCODER_CONNECT_TIMEOUT = env.float('GEOCODER_CONNECT_TIMEOUT', 3.05)
+GEOCODER_READ_TIMEOUT = env.float('GEOCODER_READ_TIMEOUT', 5)
+GEOCODER_RETRIES = env.int('GEOCODER_RETRIES', 2)
+GEOCODER_BACKOFF = env.float('GEOCODER_BACKOFF', 0.5)
+GEOCODER_POOL_SIZE = env.int('GEOCODER_POOL_SIZE', 10)
+GEOCODER_PARALLEL_REQUESTS = env.int('GEOCODER_PARALLEL_REQUESTS', 4)
+GEOCODER_RETRY_AFTER = env.int('GEOCODER_RETRY_AFTER', 60 * 60)
+GEOCODE_IN_BACKGROUND = env.bool('GEOCODE_IN_BACKGROUND', True)
+DISTANCE_PRECISE = env.bool('DISTANCE_PRECISE', False)
+CANDIDATES_NEAREST_COUNT = env.int('CANDIDATES_NEAREST_COUNT', None)
+CANDIDATES_MAX_DISTANCE_KM = env.float('CANDIDATES_MAX_DISTANCE_KM', None)
 
 ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', ['127.0.0.1', 'localhost'])
 
+ORDERS_BATCH_MAX_SIZE = env.int('ORDERS_BATCH_MAX_SIZE', 1000)
+ORDERS_BATCH_CHUNK_SIZE = env.int('ORDERS_BATCH_CHUNK_SIZE', 100)
+
+ADMISSION_CONTROL = env.bool('ADMISSION_CONTROL', False)
+ADMISSION_CACHE = 'default'
+ADMISSION_TRUST_X_FORWARDED_FOR = env.bool('ADMISSION_TRUST_X_FORWARDED_FOR', False)
+ADMISSION_MAX_IN_FLIGHT = env.int('ADMISSION_MAX_IN_FLIGHT', 32)
+ADMISSION_SCOPES = {
+    'order': {
+        'concurrency': env.int('ADMISSION_ORDER_CONCURRENCY', 24),
+        'in_flight_share': 1,
+        'rate': env.float('ADMISSION_ORDER_RATE', 0.5),
+        'burst': env.int('ADMISSION_ORDER_BURST', 10),
+    },
+    'catalog': {
+        'concurrency': env.int('ADMISSION_CATALOG_CONCURRENCY', 16),
+        'in_flight_share': 0.5,
+        'rate': env.float('ADMISSION_CATALOG_RATE', 5),
+        'burst': env.int('ADMISSION_CATALOG_BURST', 30),
+    },
+}
+
+API_JSON_COMPACT = env.bool('API_JSON_COMPACT', not DEBUG)
+API_JSON_ENCODER = env('API_JSON_ENCODER', 'foodcartapp.encoding.dumps_json')
+
+CATALOG_CACHE = 'default'
+CATALOG_SNAPSHOT_TTL = env.int('CATALOG_SNAPSHOT_TTL', 24 * 60 * 60)
+
+ORDER_FAST_VALIDATION = env.bool('ORDER_FAST_VALIDATION', False)
+ORDER_PHONENUMBER_CACHE_SIZE = env.int('ORDER_PHONENUMBER_CACHE_SIZE', 4096)
+
+ORDER_IDEMPOTENCY_KEY_TTL = env.int('ORDER_IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+
+ORDER_INTAKE_QUEUE = env.bool('ORDER_INTAKE_QUEUE', False)
+ORDER_INTAKE_JOURNAL = env(
+    'ORDER_INTAKE_JOURNAL',
+    os.path.join(BASE_DIR, 'order_intake.sqlite3'),
+)
+ORDER_INTAKE_MAX_ATTEMPTS = env.int('ORDER_INTAKE_MAX_ATTEMPTS', 5)
+
 INSTALLED_APPS = [
     'foodcartapp.apps.FoodcartappConfig',
     'restaurateur.apps.RestaurateurConfig',
@@ -92,6 +144,10 @@ WSGI_APPLICATION = 'star_burger.wsgi.application'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+CACHES = {
+    'default': env.dj_cache_url('CACHE_URL', 'locmem://'),
+}
+
 DATABASES = {
     'default': dj_database_url.config(
         default='sqlite:////{0}'.format(os.path.join(BASE_DIR, 'db.sqlite3'))